@@ -0,0 +1,175 @@
+import argparse
+import json
+import multiprocessing
+import sys
+from collections import deque
+from constants import SEARCH_DEPTH, WIN_SCORE
+from goku import Goku
+from match import SEARCH_KEYS, parse_engine
+from records import SYMBOLS, GameRecord, read_records, replay
+from stats import SearchStats
+
+# Value lost by a move, for the player who made it, that makes it a blunder
+BLUNDER_LOSS = 5000
+
+# Positions on the pool (searched or waiting) for each worker, which bounds
+# the memory of the pipeline whatever the size of the archive
+PENDING_PER_WORKER = 4
+
+# Agent, its stats, search arguments and blunder loss of each worker process
+_worker_analysis = None
+
+
+def positions(records):
+    """
+        Yields one task per move of the records: the game number, the ply and
+    the moves up to (and including) the one made on that ply
+    """
+    for game, record in enumerate(records):
+        for ply in range(len(record.moves)):
+            yield game, ply, record.moves[:ply + 1], record.size
+
+
+def analyse(records, engine, output, workers=None,
+            blunder_loss=BLUNDER_LOSS, pending=None):
+    """
+        Searches the position before every move of the records (any iterable,
+    e.g. read_records of an open file) with the engine configuration (the
+    Goku keyword arguments plus max_level or time_limit, as match.py takes
+    them) on a process pool. The best move and value are written to output
+    as a JSON line per move, with the value of the move played, searched
+    as deep, and whether it lost more than blunder_loss.
+        Positions are read lazily and at most 'pending' of them are on the
+    pool at once, so memory does not grow with the archive. Lines are
+    written in the order of the records, as soon as each one is ready.
+    Returns the number of games, positions and blunders.
+    """
+    if engine.get('engine', 'minimax') != 'minimax':
+        raise ValueError('the analysis needs the minimax engine values')
+    workers = workers or multiprocessing.cpu_count()
+    pending = pending or PENDING_PER_WORKER * workers
+    summary = {'games': 0, 'positions': 0, 'blunders': 0}
+    queue = deque()
+
+    def write(result):
+        summary['games'] = max(summary['games'], result['game'] + 1)
+        summary['positions'] += 1
+        summary['blunders'] += result['blunder']
+        output.write(json.dumps(result) + '\n')
+
+    pool = multiprocessing.Pool(workers, initializer=_init_worker,
+                                initargs=(engine, blunder_loss))
+    try:
+        for task in positions(records):
+            if len(queue) >= pending:
+                write(queue.popleft().get())
+            queue.append(pool.apply_async(_analyse_position, (task,)))
+        while queue:
+            write(queue.popleft().get())
+    finally:
+        pool.terminate()
+    return summary
+
+
+def _init_worker(engine, blunder_loss):
+    global _worker_analysis
+    search = {key: engine[key] for key in SEARCH_KEYS if key in engine}
+    stats = SearchStats()
+    agent = Goku(stats=stats, **{key: value for key, value in engine.items()
+                                 if key not in SEARCH_KEYS})
+    _worker_analysis = agent, stats, search, blunder_loss
+
+
+def _analyse_position(task):
+    game, ply, moves, size = task
+    agent, stats, search, blunder_loss = _worker_analysis
+    mover, opponent = SYMBOLS[ply % 2], SYMBOLS[1 - ply % 2]
+    board = replay(GameRecord(moves, None, size), ply).relabel(
+        {mover: 'G', opponent: 'X'})
+
+    best_move = agent.next_move(board, **search)
+    value = None if stats.value is None else float(stats.value)
+    depth = stats.depth
+    played = tuple(moves[ply])
+    best_value, played_value = _compared_values(
+        agent, board, played, best_move, value, depth,
+        search.get('max_level'))
+    loss = (None if best_value is None or played_value is None
+            else best_value - played_value)
+    return {
+        'game': game,
+        'ply': ply,
+        'player': mover,
+        'move': list(played),
+        'best_move': list(best_move),
+        'depth': depth,
+        'value': value,
+        'played_value': played_value,
+        'loss': loss,
+        'blunder': loss is not None and loss > blunder_loss
+    }
+
+
+def _compared_values(agent, board, played, best_move, value, depth,
+                     max_level):
+    """
+        Values of the best and the played move, from the mover's point of
+    view, both by a search of the same fixed depth after them: one ply
+    shallower than the best move's search, but no deeper than max_level (or
+    a fixed depth one), as time limited searches go deeper and forced wins
+    are reported with their whole length
+    """
+    if played == tuple(best_move):
+        return value, value
+    if value is None:
+        # Only a five is worth something without a search to compare with
+        index = board.index(played)
+        board = board.copy()
+        board.place(index, 'G')
+        return None, WIN_SCORE if board.is_five(index) else None
+    level = max(min(depth, max_level or SEARCH_DEPTH) - 1, 0)
+    return (_move_value(agent, board, board.index(best_move), level),
+            _move_value(agent, board, board.index(played), level))
+
+
+def _move_value(agent, board, index, level):
+    """
+        Value of the move for the player who made it ('G'), by a search of
+    the given depth after it
+    """
+    board = board.copy()
+    board.place(index, 'G')
+    if board.is_five(index):
+        return WIN_SCORE
+    value, _ = agent.minimax(board, current_player='X', max_level=level)
+    return float(value)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Searches every position of a game records file and '
+                    'writes the evaluation of each move')
+    parser.add_argument('records', help='game records file (see records.py)')
+    parser.add_argument('--engine', default='{"max_level": 2}',
+                        type=parse_engine,
+                        help='configuration of the engine, as a JSON object')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='processes to use (default: all cores)')
+    parser.add_argument('--pending', type=int, default=None,
+                        help='positions on the pool at once (default: {} '
+                             'per worker)'.format(PENDING_PER_WORKER))
+    parser.add_argument('--blunder-loss', type=float, default=BLUNDER_LOSS)
+    parser.add_argument('--output',
+                        help='JSON lines file to write (default: stdout)')
+    args = parser.parse_args()
+
+    output = open(args.output, 'w') if args.output else sys.stdout
+    try:
+        with open(args.records) as records:
+            summary = analyse(read_records(records), args.engine, output,
+                              args.workers, args.blunder_loss, args.pending)
+    finally:
+        if output is not sys.stdout:
+            output.close()
+    print(json.dumps(summary, indent=2),
+          file=sys.stderr if output is sys.stdout else sys.stdout)
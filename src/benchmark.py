@@ -0,0 +1,197 @@
+import argparse
+import json
+import platform
+import time
+from bitboard import Bitboard
+from constants import BOARD_SIZE
+from evaluation import Evaluator, PatternEvaluator
+from goku import Goku
+from transposition import TranspositionTable
+from utils import find
+
+# Fixed positions on the 15x15 board, with Goku ('G') to move
+CORPUS = {
+    'opening': {
+        'X': [(7, 7)],
+        'G': []
+    },
+    'opening_diagonal': {
+        'X': [(7, 7), (6, 8)],
+        'G': [(7, 8)]
+    },
+    'middlegame': {
+        'X': [(7, 7), (8, 8), (6, 8), (9, 6), (5, 9), (8, 6)],
+        'G': [(7, 8), (6, 7), (8, 7), (9, 7), (4, 10)]
+    },
+    'middlegame_spread': {
+        'X': [(7, 7), (7, 9), (9, 9), (5, 5), (10, 4), (3, 8), (8, 11)],
+        'G': [(7, 8), (8, 9), (6, 6), (9, 5), (4, 7), (9, 10), (2, 9)]
+    },
+    'tactical_open_three': {
+        'X': [(7, 7), (7, 8), (7, 9), (9, 9)],
+        'G': [(8, 8), (6, 6), (10, 10)]
+    },
+    'tactical_four': {
+        'X': [(5, 5), (6, 6), (7, 7), (8, 8), (3, 10)],
+        'G': [(4, 4), (7, 8), (7, 9), (7, 10), (6, 10)]
+    }
+}
+
+
+def corpus_board(name, size=BOARD_SIZE):
+    """
+        Position of the corpus, centered on a board of the given size
+    """
+    board = Bitboard(size)
+    offset = (size - 15) // 2
+    for symbol in ('X', 'G'):
+        for row, col in CORPUS[name][symbol]:
+            board.place(board.index((row + offset, col + offset)), symbol)
+    return board
+
+
+def repeat(function, min_time):
+    """
+        Calls the function until min_time seconds pass. Returns the number of
+    calls per second.
+    """
+    calls = 0
+    start = time.perf_counter()
+    elapsed = 0
+    while elapsed < min_time:
+        function()
+        calls += 1
+        elapsed = time.perf_counter() - start
+    return calls / elapsed
+
+
+def bench_evaluation(board, min_time):
+    agent = Goku()
+    array = board.to_array()
+    movement = next(board.empty_cells())
+    # Built first, so the pattern table is not timed
+    patterns = PatternEvaluator(board)
+
+    def incremental(evaluator):
+        def make_and_unmake():
+            board.place(movement, 'G')
+            evaluator.update(board, movement)
+            evaluator.score()
+            board.remove(movement)
+            evaluator.update(board, movement)
+        return make_and_unmake
+
+    return {
+        'find_per_second': repeat(lambda: find('X', 3, array), min_time),
+        'heuristic_per_second': repeat(lambda: agent.heuristic(board),
+                                       min_time),
+        'incremental_per_second': repeat(incremental(Evaluator(board)),
+                                         min_time),
+        'patterns_per_second': repeat(lambda: PatternEvaluator(board).score(),
+                                      min_time),
+        'patterns_incremental_per_second': repeat(
+            incremental(patterns), min_time)
+    }
+
+
+def bench_hashing(board, min_time):
+    table = TranspositionTable(board.size, seed=0, size_mb=1)
+    key = table.hash_key(board)
+    movement = next(board.empty_cells())
+    return {
+        'hash_key_per_second': repeat(lambda: table.hash_key(board),
+                                      min_time),
+        'update_per_second': repeat(lambda: table.update(key, movement, 'G'),
+                                    min_time)
+    }
+
+
+def bench_search(board, max_level, workers=1):
+    """
+        Time and nodes to reach each depth, with a fresh agent so the runs
+    are comparable. The nodes of a parallel search are the ones of all the
+    processes.
+    """
+    agent = Goku(seed=0, threat_nodes=0, workers=workers)
+    depths = []
+    try:
+        # The worker processes are not started on the clock
+        if workers > 1:
+            agent._worker_pool()
+        for level in range(1, max_level + 1):
+            start = time.perf_counter()
+            agent.next_move(board, max_level=level)
+            elapsed = time.perf_counter() - start
+            depths.append({
+                'depth': level,
+                'seconds': elapsed,
+                'nodes': agent._nodes,
+                'nodes_per_second': (agent._nodes / elapsed if elapsed
+                                     else 0.0)
+            })
+    finally:
+        agent.close()
+    return depths
+
+
+def bench_workers(board, max_level, workers, serial):
+    """
+        The search of bench_search with each number of workers, and its
+    speedup over the serial one given
+    """
+    results = {}
+    for count in workers:
+        depths = bench_search(board, max_level, count)
+        for depth, base in zip(depths, serial):
+            depth['speedup'] = (base['seconds'] / depth['seconds']
+                                if depth['seconds'] else 0.0)
+        results[str(count)] = depths
+    return results
+
+
+def run(names=None, max_level=3, min_time=0.2, size=BOARD_SIZE, workers=()):
+    results = {
+        'python': platform.python_version(),
+        'board_size': size,
+        'max_level': max_level,
+        'positions': {}
+    }
+    for name in names or sorted(CORPUS):
+        board = corpus_board(name, size)
+        search = bench_search(board, max_level)
+        results['positions'][name] = {
+            'stones': len(board),
+            'evaluation': bench_evaluation(board, min_time),
+            'hashing': bench_hashing(board, min_time),
+            'search': search
+        }
+        if workers:
+            results['positions'][name]['workers'] = bench_workers(
+                board, max_level, workers, search)
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Measures the evaluation, hashing and search throughput')
+    parser.add_argument('positions', nargs='*',
+                        help='positions of the corpus to run (default: all)')
+    parser.add_argument('--depth', type=int, default=3,
+                        help='deepest search to time')
+    parser.add_argument('--min-time', type=float, default=0.2,
+                        help='seconds spent on each throughput measure')
+    parser.add_argument('--size', type=int, default=BOARD_SIZE,
+                        help='board size, the positions stay centered')
+    parser.add_argument('--workers', type=int, nargs='+', default=(),
+                        help='numbers of worker processes to time the '
+                             'parallel search with')
+    parser.add_argument('--output', help='JSON file to write the results')
+    args = parser.parse_args()
+
+    results = run(args.positions, args.depth, args.min_time, args.size,
+                  args.workers)
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(results, output, indent=2)
+    else:
+        print(json.dumps(results, indent=2))
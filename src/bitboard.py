@@ -0,0 +1,345 @@
+from itertools import combinations
+import numpy as np
+from constants import BOARD_SIZE
+
+EMPTY = '.'
+
+# Positions of the empty cells inside a window of 5 cells, by their number
+GAPS = {gaps: list(combinations(range(5), gaps)) for gaps in range(1, 6)}
+
+# Positions of the empty cells among the 4 middle cells of a window of 6
+OPEN_GAPS = {gaps: list(combinations(range(1, 5), gaps))
+             for gaps in range(1, 5)}
+
+
+def popcount(mask):
+    return bin(mask).count('1')
+
+
+def bits(mask):
+    """
+        Yields the index of every bit set on the given mask, from the lowest
+    to the highest one
+    """
+    while mask:
+        lowest = mask & -mask
+        yield lowest.bit_length() - 1
+        mask ^= lowest
+
+
+class Geometry:
+    """
+        Masks shared by every board of a given size. The cells are laid out
+    row by row with one extra guard column at the end of each row, so
+    shifting a mask by one of the four direction steps never wraps a line
+    into the next one.
+    """
+    _cache = {}
+
+    def __init__(self, size):
+        self.size = size
+        self.stride = size + 1
+        self.cells = size * self.stride
+        self.board_mask = 0
+        for row in range(size):
+            self.board_mask |= ((1 << size) - 1) << (row * self.stride)
+
+        # Horizontal, vertical, diagonal and anti-diagonal steps
+        self.vectors = ((0, 1), (1, 0), (1, 1), (1, -1))
+        self.directions = tuple(row * self.stride + col
+                                for row, col in self.vectors)
+
+        # Every 5 cells window of the board and the windows through each cell
+        self.windows = []
+        self.windows_through = [[] for _ in range(self.cells)]
+        for row in range(size):
+            for col in range(size):
+                for d_row, d_col in self.vectors:
+                    end_row, end_col = row + 4 * d_row, col + 4 * d_col
+                    if not (0 <= end_row < size and 0 <= end_col < size):
+                        continue
+                    cells = [(row + i * d_row) * self.stride + col + i * d_col
+                             for i in range(5)]
+                    window = sum(1 << cell for cell in cells)
+                    self.windows.append(window)
+                    for cell in cells:
+                        self.windows_through[cell].append(window)
+
+        # Every full line of the board (rows, columns and both diagonals),
+        # as (mask, step) pairs, and the id of the 4 lines through each cell
+        self._neighbourhoods = {}
+
+        self.lines = []
+        self.lines_through = [[] for _ in range(self.cells)]
+        for step, (d_row, d_col) in zip(self.directions, self.vectors):
+            for row in range(size):
+                for col in range(size):
+                    previous = (row - d_row, col - d_col)
+                    if 0 <= previous[0] < size and 0 <= previous[1] < size:
+                        continue
+                    line_id = len(self.lines)
+                    mask = 0
+                    cell_row, cell_col = row, col
+                    while 0 <= cell_row < size and 0 <= cell_col < size:
+                        cell = cell_row * self.stride + cell_col
+                        mask |= 1 << cell
+                        self.lines_through[cell].append(line_id)
+                        cell_row, cell_col = cell_row + d_row, cell_col + d_col
+                    self.lines.append((mask, step))
+
+    def neighbourhood(self, radius):
+        """
+            For every cell, the cells at most 'radius' rows and columns away
+        from it (itself excluded)
+        """
+        if radius not in self._neighbourhoods:
+            neighbours = [()] * self.cells
+            for row in range(self.size):
+                for col in range(self.size):
+                    neighbours[row * self.stride + col] = tuple(
+                        n_row * self.stride + n_col
+                        for n_row in range(max(0, row - radius),
+                                           min(self.size, row + radius + 1))
+                        for n_col in range(max(0, col - radius),
+                                           min(self.size, col + radius + 1))
+                        if (n_row, n_col) != (row, col))
+            self._neighbourhoods[radius] = neighbours
+        return self._neighbourhoods[radius]
+
+    @classmethod
+    def of(cls, size):
+        if size not in cls._cache:
+            cls._cache[size] = cls(size)
+        return cls._cache[size]
+
+
+class Bitboard:
+    """
+        Compact board representation used by the search. Each symbol owns
+    an integer bitmask with one bit per cell, so placing, removing and
+    copying stones are plain integer operations.
+    """
+
+    def __init__(self, size=BOARD_SIZE):
+        self.size = size
+        self.geometry = Geometry.of(size)
+        self.occupied = 0
+        self._masks = {}
+
+    @classmethod
+    def from_array(cls, board):
+        """
+            Builds a bitboard from the NumPy array of characters used by the
+        command line game
+        """
+        bitboard = cls(len(board))
+        for row, col in np.argwhere(board != EMPTY):
+            bitboard.place(bitboard.index((row, col)), str(board[row, col]))
+        return bitboard
+
+    def to_array(self):
+        board = np.full((self.size, self.size), EMPTY)
+        for symbol, mask in self._masks.items():
+            for index in bits(mask):
+                board[self.position(index)] = symbol
+        return board
+
+    def __getstate__(self):
+        # The geometry is rebuilt (or taken from the cache) when unpickling
+        return self.size, self.occupied, self._masks
+
+    def __setstate__(self, state):
+        self.size, self.occupied, self._masks = state
+        self.geometry = Geometry.of(self.size)
+
+    def copy(self):
+        board = Bitboard.__new__(Bitboard)
+        board.size = self.size
+        board.geometry = self.geometry
+        board.occupied = self.occupied
+        board._masks = dict(self._masks)
+        return board
+
+    def relabel(self, symbols):
+        """
+            Copy of the board with the symbols renamed by the given dict,
+        e.g. to show a player's stones to Goku as its own
+        """
+        board = self.copy()
+        board._masks = {symbols.get(symbol, symbol): mask
+                        for symbol, mask in self._masks.items()}
+        return board
+
+    def __eq__(self, other):
+        # Same stones, ignoring symbols whose stones were all removed
+        return (isinstance(other, Bitboard) and self.size == other.size and
+                self.occupied == other.occupied and
+                all(self.mask(symbol) == other.mask(symbol)
+                    for symbol in set(self._masks) | set(other._masks)))
+
+    __hash__ = None
+
+    def index(self, position):
+        row, col = position
+        return int(row) * self.geometry.stride + int(col)
+
+    def position(self, index):
+        return divmod(index, self.geometry.stride)
+
+    def contains(self, position):
+        row, col = position
+        return 0 <= row < self.size and 0 <= col < self.size
+
+    def mask(self, symbol):
+        return self._masks.get(symbol, 0)
+
+    def symbols(self):
+        return list(self._masks)
+
+    def is_empty(self, index):
+        return not (self.occupied >> index) & 1
+
+    def get(self, index):
+        bit = 1 << index
+        for symbol, mask in self._masks.items():
+            if mask & bit:
+                return symbol
+        return EMPTY
+
+    def place(self, index, symbol):
+        bit = 1 << index
+        self._masks[symbol] = self._masks.get(symbol, 0) | bit
+        self.occupied |= bit
+
+    def remove(self, index):
+        bit = 1 << index
+        for symbol, mask in self._masks.items():
+            self._masks[symbol] = mask & ~bit
+        self.occupied &= ~bit
+
+    def stones(self, symbol):
+        return bits(self.mask(symbol))
+
+    def empty_cells(self):
+        return bits(self.geometry.board_mask & ~self.occupied)
+
+    def __len__(self):
+        return popcount(self.occupied)
+
+    def count(self, symbol, length):
+        """
+            Counts the (overlapping) runs of 'length' stones of the symbol on
+        rows, columns and both diagonals. Same results as utils.find.
+        """
+        mask = self.mask(symbol)
+        total = 0
+        for step in self.geometry.directions:
+            run = mask
+            for i in range(1, length):
+                run &= mask >> (i * step)
+            total += popcount(run)
+        return total
+
+    def has_five(self, symbol):
+        mask = self.mask(symbol)
+        for step in self.geometry.directions:
+            run = mask & (mask >> step)
+            run &= run >> (2 * step)
+            run &= mask >> (4 * step)
+            if run:
+                return True
+        return False
+
+    def five_cells(self, symbol):
+        """
+            Mask of the empty cells where the symbol would complete five in a
+        row, i.e. 4 stones and one gap inside a window of 5 cells
+        """
+        return self.threat_cells(symbol, 4)
+
+    def four_cells(self, symbol):
+        """
+            Mask of the empty cells where the symbol would make a four, i.e.
+        a window of 5 cells with 4 stones and one gap
+        """
+        return self.threat_cells(symbol, 3)
+
+    def threat_cells(self, symbol, stones):
+        """
+            Mask of the empty cells of every window of 5 cells with exactly
+        'stones' stones of the symbol and the other cells empty
+        """
+        mask = self.mask(symbol)
+        empty = self.geometry.board_mask & ~self.occupied
+        cells = 0
+        for step in self.geometry.directions:
+            shifted = [mask >> (i * step) for i in range(5)]
+            empties = [empty >> (i * step) for i in range(5)]
+            for gaps in GAPS[5 - stones]:
+                starts = -1
+                for i in range(5):
+                    starts &= empties[i] if i in gaps else shifted[i]
+                for gap in gaps:
+                    cells |= starts << (gap * step)
+        return cells
+
+    def open_cells(self, symbol, stones):
+        """
+            Mask of the empty cells of every window of 6 cells with both ends
+        empty and exactly 'stones' stones of the symbol in the middle, the
+        other cells empty. Playing one makes an open four with 3 stones and
+        an open three with 2.
+        """
+        mask = self.mask(symbol)
+        empty = self.geometry.board_mask & ~self.occupied
+        cells = 0
+        for step in self.geometry.directions:
+            shifted = [mask >> (i * step) for i in range(6)]
+            empties = [empty >> (i * step) for i in range(6)]
+            for gaps in OPEN_GAPS[4 - stones]:
+                starts = empties[0] & empties[5]
+                for i in range(1, 5):
+                    starts &= empties[i] if i in gaps else shifted[i]
+                for gap in gaps:
+                    cells |= starts << (gap * step)
+        return cells
+
+    def run_length(self, index, step):
+        """
+            Number of contiguous stones of the same symbol as the one on the
+        index, along the direction of the step (both ways)
+        """
+        symbol = self.get(index)
+        if symbol == EMPTY:
+            return 0
+        mask = self._masks[symbol]
+        length = 1
+        cell = index + step
+        while (mask >> cell) & 1:
+            length += 1
+            cell += step
+        cell = index - step
+        while cell >= 0 and (mask >> cell) & 1:
+            length += 1
+            cell -= step
+        return length
+
+    def is_five(self, index):
+        """
+            Whether the stone on the index is part of five (or more) in a row.
+        Only the 4 lines through it are checked, so it is enough to call it
+        with the last stone placed.
+        """
+        for step in self.geometry.directions:
+            if self.run_length(index, step) >= 5:
+                return True
+        return False
+
+    def winner(self):
+        """
+            Returns the symbol with five (or more) in a row, if there is one
+        """
+        for symbol in self._masks:
+            if self.has_five(symbol):
+                return symbol
+        return None
@@ -0,0 +1,204 @@
+import argparse
+import mmap
+import struct
+from bitboard import Bitboard
+from candidates import CandidateMoves
+from constants import BOARD_SIZE
+from constants import BOOK_SEED
+from goku import Goku
+from transposition import TranspositionTable
+
+# File layout: header, then the records sorted by key
+HEADER = struct.Struct('<4sHHIQ')
+RECORD = struct.Struct('<QH')
+MAGIC = b'GOKB'
+VERSION = 1
+
+
+def symmetries(size):
+    """
+        The 8 transformations of the board (rotations and reflections), as
+    functions of (row, col) positions
+    """
+    last = size - 1
+    return [
+        lambda row, col: (row, col),
+        lambda row, col: (col, last - row),
+        lambda row, col: (last - row, last - col),
+        lambda row, col: (last - col, row),
+        lambda row, col: (row, last - col),
+        lambda row, col: (col, row),
+        lambda row, col: (last - row, col),
+        lambda row, col: (last - col, last - row)
+    ]
+
+
+class BookHash:
+    """
+        Canonical Zobrist hash of a position with Goku to move: the smallest
+    of the hashes of its 8 symmetric boards, so symmetric positions share
+    the same book entry.
+    """
+
+    def __init__(self, size=BOARD_SIZE, seed=BOOK_SEED):
+        self.size = size
+        self.seed = seed
+        self._table = TranspositionTable(size, seed=seed, size_mb=0)
+        self._symmetries = symmetries(size)
+
+    def canonical(self, board):
+        """
+            Returns the canonical key and the transformation that gives it
+        """
+        stones = [(symbol, board.position(index))
+                  for symbol in board.symbols()
+                  for index in board.stones(symbol)]
+        best = None
+        for transform in self._symmetries:
+            transformed = Bitboard(self.size)
+            for symbol, position in stones:
+                transformed.place(transformed.index(transform(*position)),
+                                  symbol)
+            key = self._table.hash_key(transformed, 'G')
+            if best is None or key < best[0]:
+                best = (key, transform)
+        return best
+
+    def inverse(self, transform, position):
+        """
+            Position that the transformation takes to the given one
+        """
+        for candidate in self._symmetries:
+            row, col = transform(*candidate(*position))
+            if (row, col) == position:
+                return candidate(*position)
+        return position
+
+
+class OpeningBook:
+    """
+        Read only view of a book file. The file is memory mapped, so many
+    processes using the same book share its pages instead of loading it,
+    and the lookups are binary searches over the sorted records.
+    """
+
+    def __init__(self, path):
+        self._file = open(path, 'rb')
+        self._data = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, size, count, seed = HEADER.unpack_from(self._data, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError('{} is not an opening book file'.format(path))
+        self.size = size
+        self._count = count
+        self._hash = BookHash(size, seed)
+
+    def __len__(self):
+        return self._count
+
+    def lookup(self, board):
+        """
+            Position of the book move for Goku on the board, or None
+        """
+        if board.size != self.size:
+            return None
+        key, transform = self._hash.canonical(board)
+        move = self._find(key)
+        if move is None:
+            return None
+        row, col = divmod(move, self.size)
+        position = self._hash.inverse(transform, (row, col))
+        if not board.is_empty(board.index(position)):
+            return None
+        return position
+
+    def close(self):
+        self._data.close()
+        self._file.close()
+
+    def _find(self, key):
+        low, high = 0, self._count
+        while low < high:
+            middle = (low + high) // 2
+            record_key, move = RECORD.unpack_from(
+                self._data, HEADER.size + middle * RECORD.size)
+            if record_key < key:
+                low = middle + 1
+            elif record_key > key:
+                high = middle
+            else:
+                return move
+        return None
+
+
+def write_book(path, entries, size=BOARD_SIZE, seed=BOOK_SEED):
+    """
+        Writes the {key: (row, col)} entries, with the keys made by a
+    BookHash of the same size and seed
+    """
+    with open(path, 'wb') as book_file:
+        book_file.write(HEADER.pack(MAGIC, VERSION, size, len(entries), seed))
+        for key in sorted(entries):
+            row, col = entries[key]
+            book_file.write(RECORD.pack(key, row * size + col))
+
+
+def build_book(path, plies=4, max_level=3, replies_radius=1,
+               size=BOARD_SIZE, seed=BOOK_SEED):
+    """
+        Builds a book for every position up to 'plies' stones where Goku is
+    to move, both when it starts and when it replies. Goku's moves come from
+    a search of 'max_level' plies; every opponent reply within
+    'replies_radius' of the stones (of the centre, for the first one) is
+    followed. Symmetric positions are searched only once.
+    """
+    book_hash = BookHash(size, seed)
+    agent = Goku(threat_nodes=0)
+    entries = {}
+
+    # The opponent may open on any cell within the radius of the centre
+    frontier = [Bitboard(size)]
+    opening = Bitboard(size)
+    centre = opening.index((size // 2, size // 2))
+    for index in ((centre,) +
+                  opening.geometry.neighbourhood(replies_radius)[centre]):
+        board = opening.copy()
+        board.place(index, 'X')
+        frontier.append(board)
+
+    while frontier:
+        board = frontier.pop()
+        key, transform = book_hash.canonical(board)
+        if key in entries or len(board) >= plies:
+            continue
+        position = agent.next_move(board, max_level=max_level)
+        entries[key] = transform(*position)
+
+        board = board.copy()
+        board.place(board.index(position), 'G')
+        if len(board) + 1 >= plies:
+            continue
+        for index in CandidateMoves(board, replies_radius).moves():
+            reply = board.copy()
+            reply.place(index, 'X')
+            frontier.append(reply)
+
+    write_book(path, entries, size, seed)
+    return len(entries)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Builds an opening book for Goku')
+    parser.add_argument('path', help='book file to write')
+    parser.add_argument('--plies', type=int, default=4,
+                        help='maximum number of stones on the book positions')
+    parser.add_argument('--depth', type=int, default=3,
+                        help='search depth for the book moves')
+    parser.add_argument('--radius', type=int, default=1,
+                        help='distance of the opponent replies followed')
+    parser.add_argument('--seed', type=int, default=BOOK_SEED,
+                        help='seed of the Zobrist keys of the book')
+    args = parser.parse_args()
+    count = build_book(args.path, args.plies, args.depth, args.radius,
+                       seed=args.seed)
+    print('{} positions written to {}'.format(count, args.path))
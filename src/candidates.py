@@ -0,0 +1,56 @@
+class CandidateMoves:
+    """
+        Keeps the empty cells close to the stones on the board, which are the
+    only movements worth searching. Every placed stone increments a counter
+    on its neighbourhood, so making and unmaking moves update the set
+    without scanning the board.
+    """
+
+    def __init__(self, board, radius=2):
+        self._board = board
+        self._neighbours = board.geometry.neighbourhood(radius)
+        self._counts = [0] * board.geometry.cells
+        self._candidates = set()
+        for symbol in board.symbols():
+            for index in board.stones(symbol):
+                self.place(index)
+
+    def place(self, index):
+        """
+            Must be called after a stone is placed on the board
+        """
+        board = self._board
+        counts = self._counts
+        self._candidates.discard(index)
+        for neighbour in self._neighbours[index]:
+            counts[neighbour] += 1
+            if counts[neighbour] == 1 and board.is_empty(neighbour):
+                self._candidates.add(neighbour)
+
+    def remove(self, index):
+        """
+            Must be called after a stone is removed from the board
+        """
+        counts = self._counts
+        for neighbour in self._neighbours[index]:
+            counts[neighbour] -= 1
+            if not counts[neighbour]:
+                self._candidates.discard(neighbour)
+        if counts[index]:
+            self._candidates.add(index)
+
+    def moves(self):
+        """
+            List of candidate movements. The center of the board is the only
+        one when the board is empty.
+        """
+        if not self._candidates and not self._board.occupied:
+            center = self._board.size // 2
+            return [self._board.index((center, center))]
+        return list(self._candidates)
+
+    def __contains__(self, index):
+        return index in self._candidates
+
+    def __len__(self):
+        return len(self._candidates)
@@ -1,25 +1,26 @@
 import numpy as np
 
 BOARD_SIZE = 15
+SEARCH_DEPTH = 4
+MAX_SEARCH_DEPTH = 32
+CANDIDATE_RADIUS = 2
+VCF_DEPTH = 12
+VCT_DEPTH = 3
+THREAT_NODES = 20000
+GOKU_THREAT_NODES = 2000
+MCTS_SIMULATIONS = 1000
+QUIESCENCE_NODES = 64
+WIN_SCORE = 10 ** 9
+# Heuristic score of each doublet, triplet and quartet, and the factor
+# applied to the opponent's ones
+HEURISTIC_WEIGHTS = (1, 150, 150 * 95)
+OPPONENT_WEIGHT = 0.5
+BOOK_SEED = 20180401
 EXIT = 'get out'
 INITIAL_MENU = {
     0: 'Exit',
     1: 'Play Human vs Human',
     2: 'Play Human vs AI (Goku)'
 }
-DIRECTION_ENUM = {
-    'UP': (0, -1),
-    'DOWN': (0, 1),
-    'LEFT': (-1, 0),
-    'RIGHT': (1, 0)
-}
-
-DIRECTION_CHANGE_ENUM = {
-    'UP': 'RIGHT',
-    'DOWN': 'LEFT',
-    'LEFT': 'UP',
-    'RIGHT': 'DOWN'
-}
 
 INITIAL_BOARD = np.full((BOARD_SIZE, BOARD_SIZE), '.')
-WIN_REGEX = r'([X]{5})|([O]{5})|([G]{5})'
@@ -0,0 +1,223 @@
+import numpy as np
+from bitboard import bits, popcount, EMPTY as EMPTY_CELL
+from constants import HEURISTIC_WEIGHTS
+from constants import OPPONENT_WEIGHT
+from patterns import BLOCKED, EMPTY, OWN, PATTERN_SCORES, POWERS, RADIUS
+from patterns import pattern_table
+
+# Lengths of the runs counted by the heuristic: doublets, triplets, quartets
+RUN_LENGTHS = (2, 3, 4)
+
+
+class Evaluator:
+    """
+        Incremental version of Goku's heuristic. Keeps the count of doublets,
+    triplets and quartets of both players for every line of the board, so
+    that placing or removing a stone only recounts the 4 lines through it
+    and the leaf score is read from the running totals.
+    """
+
+    def __init__(self, board, player='G', opponent='X',
+                 weights=HEURISTIC_WEIGHTS, opponent_weight=OPPONENT_WEIGHT):
+        self._player = player
+        self._opponent = opponent
+        self._weights = weights
+        self._opponent_weight = opponent_weight
+        self.reset(board)
+
+    def reset(self, board):
+        """
+            Counts the patterns of every line from scratch
+        """
+        geometry = board.geometry
+        self._lines = geometry.lines
+        self._lines_through = geometry.lines_through
+        self._line_counts = [None] * len(self._lines)
+        # Offsets, from a cell, of the other cells of every run through it
+        self._run_offsets = [
+            np.array([[(i - j) * step for i in range(length) if i != j]
+                      for step in geometry.directions
+                      for j in range(length)])
+            for length in RUN_LENGTHS]
+        self._padding = (RUN_LENGTHS[-1] - 1) * max(geometry.directions)
+        self._totals = {self._player: [0] * len(RUN_LENGTHS),
+                        self._opponent: [0] * len(RUN_LENGTHS)}
+        for line_id in range(len(self._lines)):
+            self._recount(board, line_id)
+
+    def update(self, board, index):
+        """
+            Must be called after a stone is placed on (or removed from) the
+        given index of the board, with the board in its new state
+        """
+        for line_id in self._lines_through[index]:
+            self._recount(board, line_id)
+
+    def score(self):
+        return (self._side_score(self._player) -
+                self._opponent_weight * self._side_score(self._opponent))
+
+    def score_moves(self, board, moves, mover):
+        """
+            Scores of the boards made by placing a stone of the mover on each
+        of the given (empty) indexes, in one vectorised pass. A stone only
+        adds runs of its own symbol, the ones whose other cells are all
+        already the mover's, so each score is the current one plus the
+        weights of those runs, gathered for every movement at once.
+        """
+        padding = self._padding
+        stones = np.zeros(board.geometry.cells + 2 * padding, dtype=bool)
+        stones[[index + padding for index in board.stones(mover)]] = True
+        cells = np.asarray(moves, dtype=np.intp)[:, np.newaxis, np.newaxis]
+        gains = np.zeros(len(moves))
+        for weight, offsets in zip(self._weights, self._run_offsets):
+            runs = stones[cells + padding + offsets].all(axis=2)
+            gains += weight * runs.sum(axis=1)
+        if mover != self._player:
+            gains *= -self._opponent_weight
+        return self.score() + gains
+
+    def _side_score(self, symbol):
+        doublets, triplets, quartets = self._totals[symbol]
+        doublet, triplet, quartet = self._weights
+        return doublet * doublets + triplet * triplets + quartet * quartets
+
+    def _recount(self, board, line_id):
+        line_mask, step = self._lines[line_id]
+        previous = self._line_counts[line_id]
+        counts = tuple(self._count_line(board.mask(symbol), line_mask, step)
+                       for symbol in (self._player, self._opponent))
+        self._line_counts[line_id] = counts
+
+        for symbol, new, old in zip((self._player, self._opponent),
+                                    counts,
+                                    previous or ((0, 0, 0), (0, 0, 0))):
+            totals = self._totals[symbol]
+            for i in range(len(RUN_LENGTHS)):
+                totals[i] += new[i] - old[i]
+
+    @staticmethod
+    def _count_line(mask, line_mask, step):
+        mask &= line_mask
+        counts = []
+        run = mask
+        for length in RUN_LENGTHS:
+            # The lengths are consecutive, so one more shift extends the run
+            run &= mask >> ((length - 1) * step)
+            counts.append(popcount(run))
+        return tuple(counts)
+
+
+class PatternEvaluator:
+    """
+        Incremental evaluator that classifies the patterns of the stones
+    (five, open four, four, open three...) instead of counting runs, so a
+    dead four is not worth an open one. The window of a cell along a line,
+    seen by a player, is the base-3 index of a precomputed table (see
+    patterns.py), so scoring a stone is one lookup.
+        The window index of every cell, player and direction is kept up to
+    date: a stone is a digit of the windows of the cells at most RADIUS
+    away from it along its 4 lines, so placing or removing it only adds to
+    those 36 indexes, and scores them again, for both players.
+    """
+
+    def __init__(self, board, player='G', opponent='X',
+                 weights=PATTERN_SCORES, opponent_weight=OPPONENT_WEIGHT):
+        self._player = player
+        self._opponent = opponent
+        self._opponent_weight = opponent_weight
+        # Score of every window index, so a stone is scored by one lookup
+        self._window_scores = np.asarray(weights)[pattern_table()]
+        self.reset(board)
+
+    def reset(self, board):
+        """
+            Computes every window index and score from scratch
+        """
+        geometry = board.geometry
+        # Offsets, along each line, of the cells around a cell: the cell is
+        # the digit RADIUS - k of the window of the one k steps away
+        shifts = np.arange(-RADIUS, RADIUS + 1)
+        self._offsets = np.array(geometry.directions)[:, np.newaxis] * shifts
+        self._directions = np.arange(len(geometry.directions))[:, np.newaxis]
+        self._digits = POWERS[::-1]
+
+        # Cell values seen by each player, on a board padded with blocked
+        # cells (as is the guard column) so no window goes out of it
+        reach = RADIUS * max(geometry.directions)
+        self._padding = 2 * reach
+        length = geometry.cells + 2 * self._padding
+        self._values = np.full((2, length), BLOCKED, dtype=np.intp)
+        self._values[:, [index + self._padding
+                         for index in bits(geometry.board_mask)]] = EMPTY
+        for symbol in board.symbols():
+            stones = [index + self._padding for index in board.stones(symbol)]
+            for side, own in enumerate((self._player, self._opponent)):
+                self._values[side, stones] = (OWN if symbol == own
+                                              else BLOCKED)
+
+        # Window indexes of the cells any stone can reach
+        cells = np.arange(reach, length - reach)
+        windows = cells + self._offsets[:, :, np.newaxis]
+        self._indexes = np.zeros((2, len(self._offsets), length),
+                                 dtype=np.intp)
+        self._indexes[:, :, reach:length - reach] = np.einsum(
+            'sdwc,w->sdc', self._values[:, windows], POWERS)
+        self._totals = self._window_scores[self._indexes].sum(axis=(1, 2))
+
+    def update(self, board, index):
+        """
+            Must be called after a stone is placed on (or removed from) the
+        given index of the board, with the board in its new state
+        """
+        padded = index + self._padding
+        symbol = board.get(index)
+        changes = np.array([EMPTY if symbol == EMPTY_CELL else
+                            OWN if symbol == own else BLOCKED
+                            for own in (self._player, self._opponent)])
+        changes -= self._values[:, padded]
+        self._values[:, padded] += changes
+
+        cells = padded + self._offsets
+        indexes = self._indexes[:, self._directions, cells]
+        before = self._window_scores[indexes].sum(axis=(1, 2))
+        indexes += changes[:, np.newaxis, np.newaxis] * self._digits
+        self._indexes[:, self._directions, cells] = indexes
+        self._totals += self._window_scores[indexes].sum(axis=(1, 2)) - before
+
+    def score(self):
+        player, opponent = self._totals
+        return player - self._opponent_weight * opponent
+
+    def score_moves(self, board, moves, mover):
+        """
+            Scores of the boards made by placing a stone of the mover on each
+        of the given (empty) indexes, in one vectorised pass. The window
+        indexes around every movement are gathered at once, and the stone
+        only adds its digit to them, for both players, as it also blocks
+        the opponent's patterns.
+        """
+        cells = (np.asarray(moves, dtype=np.intp)[:, np.newaxis, np.newaxis] +
+                 self._padding + self._offsets)
+        indexes = self._indexes[:, self._directions, cells]
+        before = self._window_scores[indexes].sum(axis=(2, 3))
+        mover_side = 0 if mover == self._player else 1
+        indexes[mover_side] += OWN * self._digits
+        indexes[1 - mover_side] += BLOCKED * self._digits
+        gains = self._window_scores[indexes].sum(axis=(2, 3)) - before
+        return self.score() + gains[0] - self._opponent_weight * gains[1]
+
+
+# Evaluators Goku can search with
+EVALUATORS = {'runs': Evaluator, 'patterns': PatternEvaluator}
+
+
+def new_evaluator(kind, board, weights=None, opponent_weight=OPPONENT_WEIGHT):
+    """
+        Evaluator of the given kind for Goku ('G') against 'X', with the
+    default weights of the kind when none are given
+    """
+    if weights is None:
+        return EVALUATORS[kind](board, opponent_weight=opponent_weight)
+    return EVALUATORS[kind](board, weights=weights,
+                            opponent_weight=opponent_weight)
@@ -1,140 +1,960 @@
 import math
+import multiprocessing
+import threading
+import time
+from collections import deque
 import numpy as np
-from constants import BOARD_SIZE
-from constants import DIRECTION_ENUM
-from utils import spiral_new_direction
-from utils import sum_tuples
+from bitboard import Bitboard, Geometry, bits, popcount
+from candidates import CandidateMoves
+from constants import CANDIDATE_RADIUS
+from constants import GOKU_THREAT_NODES
+from constants import HEURISTIC_WEIGHTS
+from constants import MAX_SEARCH_DEPTH
+from constants import MCTS_SIMULATIONS
+from constants import OPPONENT_WEIGHT
+from constants import QUIESCENCE_NODES
+from constants import SEARCH_DEPTH
+from constants import WIN_SCORE
 from utils import find_doublets
 from utils import find_triplets
 from utils import find_quartets
+from evaluation import EVALUATORS, new_evaluator
+from mcts import MonteCarloTreeSearch
+from ordering import MoveOrdering
+from threats import ThreatSolver
 from transposition import TranspositionTable
+from transposition import EXACT, LOWER, UPPER
+
+# Number of nodes searched between two checks of the clock
+TIME_CHECK_NODES = 256
+
+# Width of the windows that only test a value against a bound, and of the
+# first window of the root around the value of the previous iteration
+NULL_WINDOW = 1e-3
+ASPIRATION_WINDOW = 100
+
+# Agent of each worker process of the parallel search
+_worker_agent = None
+
+
+class SearchTimeout(Exception):
+    """
+        Raised inside the search when the time limit is over
+    """
 
 
 class Goku:
     """
         Implements the AI agent for the gomoku game. It uses the minimax
     algorithm to find the best option for the next move, using alpha-beta
-    pruning
+    pruning, or a Monte Carlo tree search with engine='mcts'. Positions are
+    scored by counting runs of stones (evaluator='runs') or by classifying
+    their patterns (evaluator='patterns'), with the evaluator's default
+    weights unless given. Leaves where a four or an open three is pending
+    are resolved by a quiescence search of up to quiescence_nodes nodes
+    (0 turns it off). The nodes above the leaves score their children in one
+    batch (batch_frontier), by default only without the quiescence search,
+    as the children making threats are searched one by one anyway.
     """
 
-    def __init__(self):
-        self._transposition_table = TranspositionTable()
+    def __init__(self, seed=None, table_size_mb=16, workers=1,
+                 threat_nodes=GOKU_THREAT_NODES, book=None, stats=None,
+                 weights=None, opponent_weight=OPPONENT_WEIGHT,
+                 batch_frontier=None, table=None, engine='minimax',
+                 simulations=MCTS_SIMULATIONS, evaluator='runs',
+                 quiescence_nodes=QUIESCENCE_NODES):
+        if engine not in ('minimax', 'mcts'):
+            raise ValueError('unknown engine {}'.format(engine))
+        if evaluator not in EVALUATORS:
+            raise ValueError('unknown evaluator {}'.format(evaluator))
+        # A given table (e.g. one loaded from a file) brings its own keys
+        if table is None:
+            table = TranspositionTable(seed=seed, size_mb=table_size_mb)
+        self._transposition_table = table
+        # Parallel workers must share the Zobrist keys to merge their tables
+        self._seed = table.seed
+        self._table_size_mb = table_size_mb
+        self._workers = workers
+        self._pool = None
+        self._book = book
+        self._weights = weights
+        self._opponent_weight = opponent_weight
+        self._stats = stats
+        if batch_frontier is None:
+            batch_frontier = not quiescence_nodes
+        self._batch_frontier = batch_frontier
+        self._engine = engine
+        self._simulations = simulations
+        self._evaluator_kind = evaluator
+        self._quiescence_nodes = quiescence_nodes
+        self._quiescence_budget = 0
+        self._tree = (MonteCarloTreeSearch(seed, weights, opponent_weight,
+                                           evaluator=evaluator)
+                      if engine == 'mcts' else None)
+        self._threat_solver = (ThreatSolver(threat_nodes)
+                               if threat_nodes else None)
+        self._ordering = MoveOrdering(Geometry.of(table.size).cells)
+        self._board = None
+        self._evaluator = None
+        self._candidates = None
+        self._hash_key = 0
+        self._moves = []
+        self._deadline = None
+        self._nodes = 0
+        # Shared with the worker processes, so cancelling stops them too
+        self._stop = multiprocessing.Event()
+        # Best exact value of a root movement the workers found so far, which
+        # raises the alpha of the movements they search next
+        self._bound = multiprocessing.Value('d', -math.inf)
+        self._ponder_thread = None
+        self._pondered = None
 
-    def next_move(self, board, max_level=4):
+    def next_move(self, board, max_level=None, time_limit=None):
         """
             Makes the search and returns the coordinates for the best move
         found. Should be the only function to be called externally.
+        Accepts either a Bitboard or the NumPy array used by the game.
+            Positions on the opening book (an OpeningBook, if given) are
+        answered right away.
+            Without a time limit (in seconds) searches to a fixed depth.
+        With it, deepens one level at a time until the time is over and
+        returns the best move of the deepest search that was completed.
+            When the agent has a SearchStats, it records this search.
+            A ponder search still running is stopped. If it was pondering
+        this very position, with the same search arguments, and got to the
+        end (or thought at least for the time limit), its move is played.
         """
-        value, position = self.minimax(board, max_level=max_level)
+        if not isinstance(board, Bitboard):
+            board = Bitboard.from_array(board)
+        self.stop_pondering()
+        pondered, self._pondered = self._pondered, None
+        if self._stats is not None:
+            self._stats.start()
+
+        if pondered is not None and \
+                pondered[0] == (board, max_level, time_limit):
+            value, position, depth, line = pondered[1]
+        else:
+            value, position, depth, line = self._choose_move(
+                board, max_level, time_limit)
+        if self._stats is not None:
+            self._stats.finish(depth, value, line)
         return position
 
+    def ponder(self, board, max_level=None, time_limit=None):
+        """
+            Thinks on the opponent's time. Guesses the opponent's reply on the
+        board (where Goku just played) and searches the position after it on
+        a background thread, filling the transposition table, until the
+        search ends or stop_pondering is called. Takes the search arguments
+        of the next_move that will follow. Returns the expected reply, or
+        None when there is nothing to ponder.
+        """
+        self.stop_pondering()
+        if not isinstance(board, Bitboard):
+            board = Bitboard.from_array(board)
+        reply = self._expected_reply(board)
+        if reply < 0:
+            return None
+        board = board.copy()
+        board.place(reply, 'X')
+        if board.is_five(reply) or len(board) == board.size ** 2:
+            return None
+
+        self._ponder_thread = threading.Thread(
+            target=self._ponder, args=(board, max_level, time_limit),
+            daemon=True)
+        self._ponder_thread.start()
+        return board.position(reply)
+
+    def stop_pondering(self):
+        """
+            Cancels the ponder search, if any, and waits for its thread. The
+        search, and the worker processes searching for it, notice it as
+        they notice the time limit.
+        """
+        if self._ponder_thread is None:
+            return
+        self._stop.set()
+        self._ponder_thread.join()
+        self._ponder_thread = None
+        self._stop.clear()
+
+    def _ponder(self, board, max_level, time_limit):
+        """
+            Body of the ponder thread. A time limited search deepens without
+        limit, and is worth playing once it thought for the time limit.
+        """
+        start = time.time()
+        try:
+            result = self._choose_move(board, max_level,
+                                       None if time_limit is None
+                                       else math.inf)
+        except SearchTimeout:
+            return
+        if (time_limit is None or not self._stop.is_set() or
+                time.time() - start >= time_limit):
+            self._pondered = ((board, max_level, time_limit), result)
+
+    def _expected_reply(self, board):
+        """
+            The opponent's best movement on the board by the last search, or
+        the first one of the move ordering
+        """
+        self._start_search(board, 'X', new_search=False)
+        entry = self._transposition_table.probe(self._hash_key)
+        if entry is not None and entry[3] >= 0 and board.is_empty(entry[3]):
+            return entry[3]
+        moves = self._search_moves('X')
+        return moves[0] if moves else -1
+
+    def _choose_move(self, board, max_level, time_limit):
+        """
+            Returns the value, position and depth of the move, and the line
+        of play expected after it
+        """
+        if self._book is not None:
+            position = self._book.lookup(board)
+            if position is not None:
+                return None, position, 0, [position]
+
+        # A forced win does not need the full search
+        if self._threat_solver is not None:
+            line = (self._threat_solver.vcf(board, 'G', 'X') or
+                    self._threat_solver.vct(board, 'G', 'X'))
+            if line:
+                return WIN_SCORE, line[0], len(line), line
+
+        if self._tree is not None:
+            return self._tree_search(board, time_limit)
+
+        if time_limit is None:
+            depth = max_level or SEARCH_DEPTH
+            self._start_search(board, 'G')
+            value, position = self._search_root(depth)
+        else:
+            value, position, depth = self._iterative_deepening(
+                board, max_level or MAX_SEARCH_DEPTH, time_limit)
+        line = self._principal_variation(depth) if self._stats else []
+        return value, position, depth, line
+
+    def _tree_search(self, board, time_limit):
+        """
+            Move of the Monte Carlo tree search, which runs the simulations of
+        the agent, or as many as fit in the time limit. With workers, each
+        one grows its own tree and the visits of the root movements are
+        summed up (root parallelisation). The value is Goku's winning
+        chance.
+        """
+        if self._workers > 1:
+            tasks = [(board, self._simulations, time_limit,
+                      (self._seed + task) % 2 ** 32)
+                     for task in range(self._workers)]
+            totals = {}
+            for statistics in self._worker_pool().imap_unordered(
+                    _search_tree, tasks):
+                for movement, visits, wins in zip(*statistics):
+                    total = totals.setdefault(int(movement), [0, 0])
+                    total[0] += visits
+                    total[1] += wins
+            # Cancelled workers only ran part of the simulations
+            if time_limit is None and self._stop.is_set():
+                raise SearchTimeout()
+            movements = list(totals)
+            statistics = (movements,
+                          [totals[movement][0] for movement in movements],
+                          [totals[movement][1] for movement in movements])
+            line = []
+        else:
+            runs = self._tree.search(board, self._simulations, time_limit,
+                                     self._stop)
+            if time_limit is None and runs < self._simulations:
+                raise SearchTimeout()
+            statistics = self._tree.root_statistics()
+            line = self._tree.principal_variation()
+        if not len(statistics[0]):
+            return None, (), 0, []
+        movement, value = MonteCarloTreeSearch.best_movement(*statistics)
+        position = board.position(movement)
+        return value, position, len(line), line or [position]
+
     def minimax(self, board,
                 alpha=-math.inf,
                 beta=math.inf,
                 current_player='G',
-                max_level=4):
+                max_level=SEARCH_DEPTH):
         """
             Minimax algorith with alpha-beta prunning. Must return not only the
-        node value, but the next movement coordinates.
+        node value, but the next movement coordinates. The given board is not
+        modified, the search runs over its own copy.
+            The value is from Goku's point of view, whoever is to move; the
+        search itself is a negamax. Accepts either a Bitboard or the NumPy
+        array used by the game.
+        """
+        if not isinstance(board, Bitboard):
+            board = Bitboard.from_array(board)
+        self._start_search(board, current_player)
+        return self._minimax(alpha, beta, current_player, max_level)
+
+    def _iterative_deepening(self, board, max_level, time_limit):
+        """
+            Searches with depth 1, 2, 3... Each iteration starts from the best
+        move of the previous one, as it is kept on the transposition table.
+        A new iteration is not started once half of the time is gone, as it
+        would hardly finish.
+        """
+        start = time.time()
+        self._start_search(board, 'G', deadline=start + time_limit)
+        value, position, depth = None, (), 0
+        for level in range(1, max_level + 1):
+            try:
+                value, position = self._aspiration_search(level, value)
+                depth = level
+            except SearchTimeout:
+                while self._moves:
+                    self._unmake_move()
+                break
+            if time.time() - start > time_limit / 2:
+                break
+        self._deadline = None
+
+        # Not even the first level was completed
+        if not position:
+            moves = self._search_moves('G')
+            position = self._position(moves[0] if moves else -1)
+        return value, position, depth
+
+    def _principal_variation(self, max_level):
+        """
+            The expected line of play, following the best movements stored
+        on the transposition table from the root of the last search
+        """
+        line = []
+        player = 'G'
+        while len(line) < max_level:
+            entry = self._transposition_table.probe(self._hash_key)
+            if entry is None or entry[3] < 0:
+                break
+            movement = entry[3]
+            if not self._board.is_empty(movement):
+                break
+            line.append(self._board.position(movement))
+            self._make_move(movement, player)
+            if self._board.is_five(movement):
+                break
+            player = 'X' if player == 'G' else 'G'
+        while self._moves:
+            self._unmake_move()
+        return line
+
+    def _aspiration_search(self, max_level, guess):
+        """
+            Searches the root with a narrow window around the value of the
+        previous iteration, which prunes more while the value stays close.
+        A value outside the window is only a bound, so that side of the
+        window is opened and the root searched again.
+        """
+        if guess is None or abs(guess) >= WIN_SCORE / 2:
+            return self._search_root(max_level)
+        alpha = guess - ASPIRATION_WINDOW
+        beta = guess + ASPIRATION_WINDOW
+        while True:
+            value, position = self._search_root(max_level, alpha, beta)
+            if value <= alpha:
+                alpha = -math.inf
+            elif value >= beta:
+                beta = math.inf
+            else:
+                return value, position
+
+    def _search_root(self, max_level, alpha=-math.inf, beta=math.inf):
+        """
+            Searches the root with Goku to move, splitting the root movements
+        among the worker processes when there are any
+        """
+        if self._workers > 1 and max_level > 1:
+            return self._parallel_search(max_level, alpha, beta)
+        return self._minimax(alpha, beta, 'G', max_level)
+
+    def _parallel_search(self, max_level, alpha, beta):
+        """
+            Root splitting: the first (best ordered) movement is searched here
+        with the full window, and its value is the alpha for the remaining
+        ones, searched by the workers as the serial search does. Movements
+        failing low can not be the best, the others have exact values, so
+        the result is the same as the serial search. The workers' tables are
+        merged into this one.
+            Each worker task starts from the entries of this table and its
+        move ordering, which hold the previous iterations and the movements
+        searched so far, and its history is added back, so the workers
+        order (and find transpositions) as the serial search does. The
+        exact values they find are shared, and raise the alpha of the
+        movements searched after them.
+        """
+        table = self._transposition_table
+        entry = table.probe(self._hash_key)
+        moves = self._search_moves('G', entry[3] if entry else -1)
+        if len(moves) < 2:
+            return self._minimax(alpha, beta, 'G', max_level)
+
+        best_movement = moves[0]
+        self._make_move(best_movement, 'G')
+        value = self._child_value(best_movement, alpha, beta, 'X',
+                                  max_level - 1)
+        self._unmake_move()
+
+        if value < beta:
+            self._bound.value = -math.inf
+            queue = deque(moves[1:])
+            pending = deque()
+            try:
+                while queue or pending:
+                    # Movements are sent a few at a time, so each task takes
+                    # the entries of the ones searched before it
+                    while queue and len(pending) <= self._workers:
+                        pending.append(self._send_root_movement(
+                            queue.popleft(), max_level, max(alpha, value),
+                            beta))
+                    movement, ordering, result = pending.popleft()
+                    result = result.get()
+                    if result is None or self._stop.is_set():
+                        raise SearchTimeout()
+                    minimax, entries, history, nodes = result
+                    table.merge(entries)
+                    self._ordering.merge_history(history, ordering[0])
+                    self._nodes += nodes
+                    if minimax > value:
+                        value = minimax
+                        best_movement = movement
+            except SearchTimeout:
+                # The tasks sent return at once now, and must not hold up
+                # the pool for the next search
+                for _, _, result in pending:
+                    result.wait()
+                raise
+
+        if value <= alpha:
+            flag = UPPER
+        elif value >= beta:
+            flag = LOWER
+        else:
+            flag = EXACT
+        table.store(self._hash_key, max_level, value, flag, best_movement)
+        return value, self._position(best_movement)
+
+    def _send_root_movement(self, movement, max_level, alpha, beta):
+        """
+            Sends the search of a root movement to the workers, with the
+        entries and the move ordering of this search. Returns the movement,
+        the ordering sent and the pending result.
+        """
+        ordering = self._ordering.state()
+        seed = self._transposition_table.entries(min_depth=1), ordering
+        task = (self._board, movement, max_level, alpha, beta,
+                self._deadline, seed)
+        return movement, ordering, self._worker_pool().apply_async(
+            _search_root_movement, (task,))
+
+    def _search_root_movement(self, board, movement, max_level, alpha, beta,
+                              deadline, seed):
+        """
+            Worker side of the parallel search: the value of the root movement
+        (or a bound not above alpha), the table entries and the move ordering
+        history of this search, and the nodes searched. Returns None if the
+        deadline is reached, or the search cancelled.
+            A movement of equal value found before is only a bound just below
+        it, so ties are still won by the first movement, as serially.
+        """
+        # The entries sent are aged, so only the ones of this search are
+        # sent back
+        entries, ordering = seed
+        self._transposition_table.merge(entries)
+        self._transposition_table.new_search()
+        self._ordering.load(ordering)
+        self._start_search(board, 'G', deadline, new_search=False)
+        if self._out_of_time():
+            return None
+        alpha = max(alpha, self._bound.value - NULL_WINDOW)
+        self._make_move(movement, 'G')
+        try:
+            value = self._search_child(movement, alpha, beta, 'X',
+                                       max_level - 1, null_window=True)
+        except SearchTimeout:
+            return None
+        if alpha < value < beta:
+            with self._bound.get_lock():
+                self._bound.value = max(self._bound.value, value)
+        return (value, self._transposition_table.entries(min_depth=1),
+                self._ordering.state()[0], self._nodes)
+
+    def _worker_pool(self):
+        if self._pool is None:
+            self._pool = multiprocessing.Pool(
+                self._workers,
+                initializer=_init_worker,
+                initargs=(self._seed, self._table_size_mb, self._weights,
+                          self._opponent_weight, self._batch_frontier,
+                          self._engine, self._simulations,
+                          self._evaluator_kind, self._quiescence_nodes,
+                          self._stop, self._bound))
+        return self._pool
+
+    def save_table(self, path):
+        """
+            Saves the transposition table, to warm up another agent with
+        Goku(table=TranspositionTable.load(path))
+        """
+        self.stop_pondering()
+        self._transposition_table.save(path)
+
+    def close(self):
+        """
+            Stops the pondering and the worker processes of the parallel
+        search, if any
+        """
+        self.stop_pondering()
+        if self._pool is not None:
+            self._pool.terminate()
+            self._pool = None
+
+    def _start_search(self, board, current_player, deadline=None,
+                      new_search=True):
+        if board.size != self._transposition_table.size:
+            self._resize(board.size)
+        self._board = board.copy()
+        if new_search:
+            self._transposition_table.new_search()
+            self._ordering.new_search()
+        self._evaluator = new_evaluator(self._evaluator_kind, self._board,
+                                        self._weights, self._opponent_weight)
+        self._candidates = CandidateMoves(self._board, CANDIDATE_RADIUS)
+        start = time.perf_counter()
+        self._hash_key = self._transposition_table.hash_key(self._board,
+                                                            current_player)
+        if self._stats is not None:
+            self._stats.hashing(time.perf_counter() - start)
+        self._moves = []
+        self._deadline = deadline
+        self._nodes = 0
+
+    def _resize(self, size):
+        """
+            Starts over the table and the move ordering for a board of
+        another size, keeping the seed of the Zobrist keys
+        """
+        self._transposition_table = TranspositionTable(
+            size, seed=self._seed, size_mb=self._table_size_mb)
+        self._ordering = MoveOrdering(Geometry.of(size).cells)
+
+    def _make_move(self, movement, player):
+        """
+            Places a stone on the search board, keeping the evaluator and the
+        hash key in sync and stacking the movement so it can be undone
+        """
+        self._board.place(movement, player)
+        self._evaluator.update(self._board, movement)
+        self._candidates.place(movement)
+        self._update_hash(movement, player)
+        self._moves.append((movement, player))
+
+    def _unmake_move(self):
+        movement, player = self._moves.pop()
+        self._board.remove(movement)
+        self._evaluator.update(self._board, movement)
+        self._candidates.remove(movement)
+        self._update_hash(movement, player)
+
+    def _update_hash(self, movement, player):
+        """
+            Toggles the stone on the hash key, which places or removes it
+        """
+        if self._stats is None:
+            self._hash_key = self._transposition_table.update(self._hash_key,
+                                                              movement,
+                                                              player)
+        else:
+            start = time.perf_counter()
+            self._hash_key = self._transposition_table.update(self._hash_key,
+                                                              movement,
+                                                              player)
+            self._stats.hashing(time.perf_counter() - start)
+
+    def _minimax(self, alpha, beta, current_player, max_level):
+        """
+            Searches the current position with the window and the value from
+        Goku's point of view, as the public minimax does, over the negamax
+        search
+        """
+        if current_player == 'G':
+            value, movement = self._negamax(alpha, beta, 'G', max_level)
+        else:
+            value, movement = self._negamax(-beta, -alpha, 'X', max_level)
+            value = -value
+        return value, self._position(movement)
+
+    def _negamax(self, alpha, beta, current_player, max_level):
+        """
+            Recursive step of the search, over the search board. Each child is
+        made, searched and unmade, so the board is the same on return.
+        Scores are from the point of view of the player to move, and so are
+        the table bounds. Returns the value and the best movement.
+            Principal variation search: the first (best ordered) movement is
+        searched with the full window, the others only with a null window,
+        proving they are not better, and searched again when they are.
+        Values outside the window are bounds (fail soft).
         """
-        best_movement = ()
+        table = self._transposition_table
+        hash_key = self._hash_key
+        best_movement = -1
+
+        stats = self._stats
+        self._nodes += 1
+        if not self._nodes % TIME_CHECK_NODES and self._out_of_time():
+            raise SearchTimeout()
 
         # Leaf node
         if max_level == 0:
-            return (self.heuristic(board), ())
+            if stats is None:
+                score = self._evaluator.score()
+            else:
+                start = time.perf_counter()
+                score = self._evaluator.score()
+                stats.node(len(self._moves))
+                stats.evaluation(time.perf_counter() - start)
+            score = score if current_player == 'G' else -score
+            if self._quiescence_nodes:
+                score = self._quiescence_leaf(alpha, beta, current_player,
+                                              score)
+            return score, -1
 
-        if current_player == 'G':
+        entry = table.probe(hash_key)
+        if stats is not None:
+            stats.node(len(self._moves))
+            stats.probe(entry is not None)
+        if entry is not None:
+            depth, score, flag, best_movement = entry
+            if depth >= max_level:
+                if flag == LOWER:
+                    alpha = max(alpha, score)
+                elif flag == UPPER:
+                    beta = min(beta, score)
+                if flag == EXACT or beta <= alpha:
+                    return score, best_movement
+        initial_alpha, initial_beta = alpha, beta
+        ply = len(self._moves)
+        opponent = 'X' if current_player == 'G' else 'G'
+
+        moves = self._search_moves(current_player, best_movement)
+        if (max_level == 1 and self._batch_frontier and moves and
+                not self._threat_pending(current_player)):
+            value, best_movement = self._frontier(moves, current_player,
+                                                  alpha, beta)
+        else:
             value = -math.inf
-            for movement in self.all_movement_possibilities(board):
-                next_board = np.copy(board)
-                next_board[movement] = current_player
-                hash_key = self._transposition_table.hash_key(next_board)
-                if self._transposition_table.contains(hash_key):
-                    minimax = self._transposition_table.value(hash_key)
-                else:
-                    minimax, _ = self.minimax(next_board,
-                                              alpha,
-                                              beta,
-                                              'X',
-                                              max_level - 1)
-                    self._transposition_table.insert(hash_key, minimax)
-                if minimax > value:
-                    value = minimax
+            for move_index, movement in enumerate(moves):
+                self._make_move(movement, current_player)
+                score = self._search_child(movement, alpha, beta, opponent,
+                                           max_level - 1, move_index > 0)
+                self._unmake_move()
+                if score > value:
+                    value = score
                     best_movement = movement
                 alpha = max(value, alpha)
 
                 # Cutting off
                 if beta <= alpha:
+                    self._cutoff(movement, move_index, ply, max_level,
+                                 current_player)
                     break
-            return value, best_movement
+
+        if value <= initial_alpha:
+            flag = UPPER
+        elif value >= initial_beta:
+            flag = LOWER
         else:
-            value = math.inf
-            for movement in self.all_movement_possibilities(board):
-                next_board = np.copy(board)
-                next_board[movement] = current_player
-                hash_key = self._transposition_table.hash_key(next_board)
-                if self._transposition_table.contains(hash_key):
-                    minimax = self._transposition_table.value(hash_key)
-                else:
-                    minimax, _ = self.minimax(next_board,
-                                              beta,
-                                              alpha,
-                                              'G',
-                                              max_level - 1)
-                    self._transposition_table.insert(hash_key, minimax)
-                if minimax < value:
-                    value = minimax
-                    best_movement = movement
-                beta = min(value, beta)
+            flag = EXACT
+        table.store(hash_key, max_level, value, flag, best_movement)
+        if stats is not None:
+            stats.store()
+        return value, best_movement
 
-                # Cutting off
-                if beta <= alpha:
+    def _frontier(self, moves, current_player, alpha, beta):
+        """
+            Value of a node one ply above the leaves. Its children are scored
+        together by the evaluator instead of being made and searched one by
+        one; the ones making five are terminal. Every quiet child is scored,
+        so the value is the best one, not only a bound, and the cutoff, if
+        any, is counted on the best movement.
+            Children making a threat are then made and resolved by the
+        quiescence search, the best scored first, until one reaches beta;
+        the ones left are not counted. Nodes with a threat already pending
+        are not batched, as all their children would be searched this way.
+        """
+        stats = self._stats
+        start = time.perf_counter() if stats is not None else 0
+        scores = self._evaluator.score_moves(self._board, moves,
+                                             current_player)
+        if current_player != 'G':
+            scores = -scores
+        fives = self._board.five_cells(current_player)
+        if fives:
+            for move_index, movement in enumerate(moves):
+                if fives >> movement & 1:
+                    scores[move_index] = WIN_SCORE - len(self._moves) - 1
+        self._nodes += len(moves)
+        if stats is not None:
+            stats.node(len(self._moves) + 1, len(moves))
+            stats.evaluation(time.perf_counter() - start, len(moves))
+
+        unstable = (self._unstable_children(moves, current_player, fives)
+                    if self._quiescence_nodes else [])
+        if unstable:
+            opponent = 'X' if current_player == 'G' else 'G'
+            statics = scores[unstable]
+            scores[unstable] = -math.inf
+            alpha = max(alpha, scores.max())
+            for static, move_index in sorted(zip(statics, unstable),
+                                             reverse=True):
+                if alpha >= beta:
                     break
-            return value, best_movement
+                self._make_move(moves[move_index], current_player)
+                score = -self._quiescence_leaf(-beta, -alpha, opponent,
+                                               -static)
+                self._unmake_move()
+                scores[move_index] = score
+                alpha = max(alpha, score)
 
-    def all_movement_possibilities(self, board):
+        move_index = int(np.argmax(scores))
+        if scores[move_index] >= beta:
+            self._cutoff(moves[move_index], move_index, len(self._moves), 1,
+                         current_player)
+        return float(scores[move_index]), moves[move_index]
+
+    def _threat_pending(self, current_player):
         """
-            Makes a spiral movement through the board, starting from the center
+            Whether, with the quiescence search on, a five or an open three
+        of either player is on the board, so a threat may be pending after
+        any child of the node
         """
-        repeating_positions = False
-        central_index = BOARD_SIZE // 2
-        current_position = (central_index, central_index)
-        current_direction = 'DOWN'
-        change_move_count = 1
-        current_move_count = 1
-        local_count = 2
+        if not self._quiescence_nodes:
+            return False
+        board = self._board
+        opponent = 'X' if current_player == 'G' else 'G'
+        return bool(board.five_cells(current_player) or
+                    board.five_cells(opponent) or
+                    board.open_cells(current_player, 3) or
+                    board.open_cells(opponent, 3))
 
-        while not repeating_positions:
-            current_move_count -= 1
+    def _unstable_children(self, moves, current_player, fives):
+        """
+            Indexes of the movements (other than the ones making five) after
+        which a four or an open three may be pending, on a board without
+        threats: the ones making a four or an open three
+        """
+        board = self._board
+        made = (board.four_cells(current_player) |
+                board.open_cells(current_player, 2))
+        return [move_index for move_index, movement in enumerate(moves)
+                if not fives >> movement & 1 and made >> movement & 1]
 
-            if board[current_position] == '.':
-                yield current_position
+    def _quiescence_leaf(self, alpha, beta, current_player, static):
+        """
+            Value of a leaf, whose evaluation (for the player to move) is
+        'static', resolved by a quiescence search of its own node budget
+        """
+        self._quiescence_budget = self._quiescence_nodes
+        value = self._quiescence(alpha, beta, current_player, static)
+        if self._stats is not None:
+            self._stats.quiescence(self._quiescence_nodes -
+                                   self._quiescence_budget)
+        return value
 
-            current_position = sum_tuples(current_position,
-                                          DIRECTION_ENUM[current_direction])
+    def _quiescence(self, alpha, beta, current_player, static=None):
+        """
+            Searches only the forcing movements of the search board, so the
+        leaf values do not miss the threats just beyond the horizon. A four
+        of the opponent must be blocked. Otherwise, when a four or an open
+        three is pending, the player may keep the evaluation (stand pat,
+        unless the opponent has an open three) or make a four, block the
+        opponent's open three or make an open three. Quiet positions, and
+        the ones reached once the node budget is over, keep the evaluation.
+        """
+        board = self._board
+        opponent = 'X' if current_player == 'G' else 'G'
+        ply = len(self._moves)
+        self._nodes += 1
+        self._quiescence_budget -= 1
+        if not self._nodes % TIME_CHECK_NODES and self._out_of_time():
+            raise SearchTimeout()
 
-            if BOARD_SIZE in current_position:
-                repeating_positions = True
+        if board.five_cells(current_player):
+            return WIN_SCORE - ply - 1
+        fours = board.five_cells(opponent)
+        if popcount(fours) > 1:
+            return -(WIN_SCORE - ply - 2)
+        if static is None:
+            static = self._evaluator.score()
+            static = static if current_player == 'G' else -static
+        if self._quiescence_budget <= 0:
+            return static
 
-            if current_move_count == 0:
-                local_count -= 1
-                if not local_count:
-                    local_count = 2
-                    change_move_count += 1
+        if fours:
+            value = -math.inf
+            moves = [fours.bit_length() - 1]
+        else:
+            # An open four wins, unless the opponent can answer with fours
+            if board.open_cells(current_player, 3):
+                if not board.four_cells(opponent):
+                    return WIN_SCORE - ply - 3
+            threes = board.open_cells(opponent, 3)
+            if not threes and not board.open_cells(current_player, 3):
+                return static
+            value = -math.inf if threes else static
+            if value >= beta:
+                return value
+            alpha = max(alpha, value)
+            made = board.four_cells(current_player)
+            moves = list(bits(made)) + list(bits(threes & ~made))
+            if not threes:
+                moves += list(bits(board.open_cells(current_player, 2) &
+                                   ~made))
+
+        for movement in moves:
+            self._make_move(movement, current_player)
+            if board.is_five(movement):
+                score = WIN_SCORE - len(self._moves)
+            else:
+                score = -self._quiescence(-beta, -alpha, opponent)
+            self._unmake_move()
+            value = max(value, score)
+            alpha = max(alpha, value)
+            if alpha >= beta:
+                break
+        return value
 
-                current_move_count = change_move_count
-                current_direction = spiral_new_direction(current_direction)
+    def _out_of_time(self):
+        """
+            Whether the search must stop: its deadline is over or it was
+        cancelled, as pondering is
+        """
+        return self._stop.is_set() or (self._deadline is not None and
+                                       time.time() > self._deadline)
+
+    def _cutoff(self, movement, move_index, ply, max_level, current_player):
+        self._ordering.cutoff(movement, move_index, ply, max_level,
+                              current_player)
+        if self._stats is not None:
+            self._stats.cutoff(move_index)
+
+    def _search_child(self, movement, alpha, beta, next_player, max_level,
+                      null_window):
+        """
+            Value of the position after the movement, for the player who made
+        it. With null_window, it is first only tested against alpha, and
+        searched with the full window when it turns out better.
+        """
+        if null_window and beta - alpha > NULL_WINDOW:
+            value = self._child_value(movement, alpha, alpha + NULL_WINDOW,
+                                      next_player, max_level)
+            if not alpha < value < beta:
+                return value
+        return self._child_value(movement, alpha, beta, next_player,
+                                 max_level)
+
+    def _child_value(self, movement, alpha, beta, next_player, max_level):
+        """
+            Value of the position after the movement, for the player who made
+        it, which is a terminal one when it made five. Quicker wins (and
+        slower losses) score better.
+        """
+        if self._board.is_five(movement):
+            return WIN_SCORE - len(self._moves)
+        value, _ = self._negamax(-beta, -alpha, next_player, max_level)
+        return -value
+
+    def _search_moves(self, current_player, first=-1):
+        """
+            Movements of the search board for the player, best ones first.
+        'first' is the best movement stored on the transposition table.
+        """
+        opponent = 'X' if current_player == 'G' else 'G'
+        start = time.perf_counter() if self._stats is not None else 0
+        moves = self._ordering.order(self._candidates.moves(),
+                                     self._board,
+                                     len(self._moves),
+                                     current_player,
+                                     opponent,
+                                     first)
+        if self._stats is not None:
+            self._stats.generation(len(moves), time.perf_counter() - start)
+        return moves
+
+    def cutoff_stats(self):
+        """
+            How many alpha-beta cutoffs the last search had, and on which
+        movement of the ordered list they happened
+        """
+        return self._ordering.stats()
+
+    def _position(self, movement):
+        return self._board.position(movement) if movement >= 0 else ()
+
+    def all_movement_possibilities(self, board):
+        """
+            Position (row, col) of every empty cell close enough to the
+        stones on the board to be worth searching, or the center when the
+        board is empty. Accepts either a Bitboard or the NumPy array used by
+        the game.
+        """
+        if not isinstance(board, Bitboard):
+            board = Bitboard.from_array(board)
+        return [board.position(index)
+                for index in CandidateMoves(board, CANDIDATE_RADIUS).moves()]
 
     def heuristic(self, board):
         """
             The heuristic for the Goku agent. An estimative of how close
         we are to win the game, cause is the only thing that matters!
         """
-        postive_factor = (find_doublets('G', board) +
-                          150 * (find_triplets('G', board) +
-                          95 * find_quartets('G', board)))
-        negative_factor = (find_doublets('X', board) +
-                           150 * (find_triplets('X', board) +
-                           95 * find_quartets('X', board)))
+        if self._evaluator_kind != 'runs':
+            if not isinstance(board, Bitboard):
+                board = Bitboard.from_array(board)
+            return new_evaluator(self._evaluator_kind, board, self._weights,
+                                 self._opponent_weight).score()
+        doublet, triplet, quartet = (HEURISTIC_WEIGHTS if self._weights is None
+                                     else self._weights)
+        postive_factor = (doublet * find_doublets('G', board) +
+                          triplet * find_triplets('G', board) +
+                          quartet * find_quartets('G', board))
+        negative_factor = (doublet * find_doublets('X', board) +
+                           triplet * find_triplets('X', board) +
+                           quartet * find_quartets('X', board))
+
+        return postive_factor - self._opponent_weight * negative_factor
+
+
+def _init_worker(seed, table_size_mb, weights, opponent_weight,
+                 batch_frontier, engine, simulations, evaluator,
+                 quiescence_nodes, stop, bound):
+    global _worker_agent
+    _worker_agent = Goku(seed=seed, table_size_mb=table_size_mb,
+                         weights=weights, opponent_weight=opponent_weight,
+                         batch_frontier=batch_frontier, engine=engine,
+                         simulations=simulations, evaluator=evaluator,
+                         quiescence_nodes=quiescence_nodes)
+    # The searches of the worker stop with the ones of its agent, and share
+    # its bound
+    _worker_agent._stop = stop
+    _worker_agent._bound = bound
+
+
+def _search_root_movement(task):
+    return _worker_agent._search_root_movement(*task)
+
 
-        return postive_factor - 0.5 * negative_factor
+def _search_tree(task):
+    board, simulations, time_limit, seed = task
+    tree = _worker_agent._tree
+    tree.seed(seed)
+    tree.search(board, simulations, time_limit, _worker_agent._stop)
+    return tree.root_statistics()
@@ -1,7 +1,5 @@
-import numpy as np
-import regex as re
-
-from constants import BOARD_SIZE, INITIAL_BOARD, INITIAL_MENU, WIN_REGEX
+from bitboard import Bitboard
+from constants import BOARD_SIZE, INITIAL_MENU
 from goku import Goku
 
 
@@ -10,8 +8,8 @@ class Gomoku:
         This class contains all the components needed to run the base game.
         It should not have any AI related functionality.
     """
-    def __init__(self):
-        self._board = np.copy(INITIAL_BOARD)
+    def __init__(self, board_size=BOARD_SIZE, ponder=True):
+        self._board = Bitboard(board_size)
         self._menu = INITIAL_MENU
         self._winner = None
         self._players = {
@@ -21,6 +19,7 @@ class Gomoku:
         }
         self._actual_player = 0
         self._ai_agent = Goku()
+        self._ponder = ponder
 
     def run(self):
         self.render()
@@ -48,10 +47,15 @@ class Gomoku:
                     print('Position already in use or out of the board!')
                     continue
                 self._toggle_player()
-                self._winner = self._game_finished()
+                self._winner = self._game_finished(move)
+                if self._ponder and mode == 2 and not self._winner and \
+                        self._actual_player == 0:
+                    # Goku keeps thinking while the human chooses a move
+                    self._ai_agent.ponder(self._board)
             except ValueError:
                 print('\nOption(s) is(are) not number(s). Try again!')
                 self._winner = False
+        self._ai_agent.stop_pondering()
         self._render_board()
         print('We have a winner')
 
@@ -76,68 +80,16 @@ class Gomoku:
         """
             Only renders de game board on the screen with coordinates
         """
-        for index, row in enumerate(self._board):
+        board = self._board.to_array()
+        for index, row in enumerate(board):
             print(index, end='  ') if index < 10 else print(index, end=' ')
             list(map(lambda x: print(x, end='  '), row))
             print()
         print('   ', end='')
-        for i in range(len(self._board)):
+        for i in range(len(board)):
             print(i, end='  ') if i < 10 else print(i, end=' ')
         print()
 
-    def _check_row(self):
-        """
-            Checks if the board is finished. i.e. some player has made
-            5 in a row.
-            Returns the symbol of the winner player, if there is one
-        """
-        match = None
-        for row in self._board:
-            row_string = ''.join(row)
-            match = re.search(WIN_REGEX, row_string)
-            if match:
-                return match.group()[0]
-        return None
-
-    def _check_column(self):
-        """
-            Checks if the board is finished. i.e. some player has made
-            5 in a column
-            Returns the symbol of the winner player, if there is one
-        """
-        for column in np.transpose(self._board):
-            col_string = ''.join(column)
-            match = re.search(WIN_REGEX, col_string)
-            if match:
-                return match.group()[0]
-        return None
-
-    def _check_diagonal(self):
-        """
-            Checks if the board is finished. i.e. some player has made
-            5 in a diagonal
-        """
-        # Search for the first direction
-        index = - (BOARD_SIZE + 1)
-        while index < BOARD_SIZE:
-            diagonal_string = ''.join(self._board.diagonal(index))
-            match = re.search(WIN_REGEX, diagonal_string)
-            if match:
-                return match.group()[0]
-            index += 1
-
-        # Search for the other direction
-        index = - (BOARD_SIZE + 1)
-        flipped_board = np.fliplr(self._board)
-        while index < BOARD_SIZE:
-            diagonal_string = ''.join(flipped_board.diagonal(index))
-            match = re.search(WIN_REGEX, diagonal_string)
-            if match:
-                return match.group()[0]
-            index += 1
-
-        return None
-
     def _toggle_player(self):
         if self._game_mode == 2:
             self._actual_player = 0 if self._actual_player else 2
@@ -145,16 +97,24 @@ class Gomoku:
             self._actual_player = 0 if self._actual_player else 1
 
     def _mark_board(self, player, position):
-        if not self._valid_position(position) or self._board[position] != '.':
+        if not self._valid_position(position):
             return False
-        self._board[position] = self._players[player]
+        index = self._board.index(position)
+        if not self._board.is_empty(index):
+            return False
+        self._board.place(index, self._players[player])
         return True
 
-    def _game_finished(self):
-        return self._check_row() \
-                or self._check_column() \
-                or self._check_diagonal()
+    def _game_finished(self, position):
+        """
+            Checks if the board is finished. i.e. the player of the last move,
+            on the given position, has made 5 in a row, column or diagonal.
+            Returns the symbol of the winner player, if there is one
+        """
+        index = self._board.index(position)
+        if self._board.is_five(index):
+            return self._board.get(index)
+        return None
 
     def _valid_position(self, position):
-        x_coord, y_coord = position
-        return 0 <= x_coord <= BOARD_SIZE and 0 <= y_coord <= BOARD_SIZE
+        return self._board.contains(position)
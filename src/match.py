@@ -0,0 +1,235 @@
+import argparse
+import json
+import math
+import multiprocessing
+import numpy as np
+from bitboard import Bitboard
+from candidates import CandidateMoves
+from constants import BOARD_SIZE
+from goku import Goku
+
+# Opening lines, as moves alternated between the first and second player,
+# given by their offsets (rows, columns) from the center of the board
+OPENINGS = [
+    [(0, 0), (0, 1)],
+    [(0, 0), (-1, 1)],
+    [(0, 0), (0, 1), (1, 0)],
+    [(0, 0), (-1, 1), (1, 1)],
+    [(0, 0), (0, 2), (1, 1)],
+    [(0, 0), (-2, 2), (-1, 1)],
+    [(0, 0), (1, 1), (-1, -1), (0, 2)],
+    [(0, 0), (-1, 0), (1, 1), (-2, 2)]
+]
+
+# Keys of an engine configuration understood by the runner, besides the
+# keyword arguments of Goku
+SEARCH_KEYS = ('max_level', 'time_limit')
+
+
+def book_opening(number, size=BOARD_SIZE):
+    """
+        Moves of the opening of OPENINGS with that number (taken cyclically)
+    on a board of the given size
+    """
+    board = Bitboard(size)
+    center = size // 2
+    moves = [(center + row, center + col)
+             for row, col in OPENINGS[number % len(OPENINGS)]]
+    if not all(board.contains(position) for position in moves):
+        raise ValueError('the openings do not fit a board of size {}'
+                         .format(size))
+    return moves
+
+
+def random_opening(random, plies, size=BOARD_SIZE):
+    """
+        Random moves close to the center of the board
+    """
+    board = Bitboard(size)
+    moves = []
+    for ply in range(plies):
+        candidates = CandidateMoves(board, radius=1).moves()
+        index = int(random.choice(candidates))
+        board.place(index, 'XO'[ply % 2])
+        moves.append(board.position(index))
+    return moves
+
+
+def play_game(first, second, opening=(), max_moves=None, size=BOARD_SIZE):
+    """
+        Plays one game between two engine configurations (dicts with the
+    Goku keyword arguments plus max_level and time_limit). Each engine sees
+    its own stones as Goku's. Returns 1 if the first engine wins, -1 if the
+    second one does and 0 for a draw, and the list of moves.
+    """
+    board = Bitboard(size)
+    engines = []
+    for config in (first, second):
+        search = {key: config[key] for key in SEARCH_KEYS if key in config}
+        agent = Goku(**{key: value for key, value in config.items()
+                        if key not in SEARCH_KEYS})
+        engines.append((agent, search))
+    symbols = ('X', 'O')
+    max_moves = max_moves or size * size
+
+    moves = []
+    result = 0
+    for turn in range(max_moves):
+        player = turn % 2
+        if turn < len(opening):
+            position = tuple(opening[turn])
+        else:
+            agent, search = engines[player]
+            view = board.relabel({symbols[player]: 'G',
+                                  symbols[1 - player]: 'X'})
+            position = agent.next_move(view, **search)
+
+        if not position or not board.contains(position) or \
+                not board.is_empty(board.index(position)):
+            # An illegal move loses the game
+            result = -1 if player == 0 else 1
+            break
+        index = board.index(position)
+        board.place(index, symbols[player])
+        moves.append(position)
+        if board.is_five(index):
+            result = 1 if player == 0 else -1
+            break
+        if len(board) == size * size:
+            break
+
+    for agent, _ in engines:
+        agent.close()
+    return result, moves
+
+
+def _play_task(task):
+    game, first, second, opening, swapped, max_moves, size = task
+    result, moves = play_game(first, second, opening, max_moves, size)
+    # Results are always from the point of view of engine A
+    return {
+        'game': game,
+        'a_first': not swapped,
+        'result': -result if swapped else result,
+        'moves': [list(move) for move in moves]
+    }
+
+
+def elo_difference(wins, draws, losses):
+    """
+        Elo difference of an engine with the given results, and the margin
+    of its 95% confidence interval
+    """
+    games = wins + draws + losses
+    if not games:
+        return 0.0, math.inf
+    score = (wins + 0.5 * draws) / games
+    if score <= 0 or score >= 1:
+        return (-math.inf if score <= 0 else math.inf), math.inf
+
+    def elo(score):
+        return -400 * math.log10(1 / score - 1)
+
+    deviation = math.sqrt((wins * (1 - score) ** 2 +
+                           draws * (0.5 - score) ** 2 +
+                           losses * score ** 2) / games) / math.sqrt(games)
+    low = max(score - 1.96 * deviation, 1e-9)
+    high = min(score + 1.96 * deviation, 1 - 1e-9)
+    return elo(score), (elo(high) - elo(low)) / 2
+
+
+def run_match(engine_a, engine_b, games=100, workers=None, openings='random',
+              opening_plies=2, max_moves=None, seed=None, output=None,
+              size=BOARD_SIZE):
+    """
+        Plays the games between engines A and B on a process pool, on
+    boards of the given size. Each opening is played twice, with the
+    engines swapping colours. Openings are random ('random', with
+    opening_plies moves) or taken from OPENINGS ('book'). Every game is
+    written as a JSON line to output, if given. Returns the statistics from
+    A's point of view.
+    """
+    random = np.random.RandomState(seed)
+    tasks = []
+    for game in range(games):
+        if game % 2 == 0:
+            if openings == 'book':
+                opening = book_opening(game // 2, size)
+            else:
+                opening = random_opening(random, opening_plies, size)
+        swapped = game % 2 == 1
+        first, second = ((engine_b, engine_a) if swapped
+                         else (engine_a, engine_b))
+        tasks.append((game, first, second, opening, swapped, max_moves,
+                      size))
+
+    wins = draws = losses = 0
+    pool = multiprocessing.Pool(workers)
+    try:
+        for record in pool.imap_unordered(_play_task, tasks):
+            if record['result'] > 0:
+                wins += 1
+            elif record['result'] < 0:
+                losses += 1
+            else:
+                draws += 1
+            if output is not None:
+                output.write(json.dumps(record) + '\n')
+    finally:
+        pool.terminate()
+
+    elo, margin = elo_difference(wins, draws, losses)
+    return {
+        'games': games,
+        'wins': wins,
+        'draws': draws,
+        'losses': losses,
+        'score': (wins + 0.5 * draws) / games if games else 0.0,
+        'elo': elo,
+        'elo_margin': margin
+    }
+
+
+def parse_engine(text):
+    """
+        Engine configuration from a JSON object, e.g.
+    '{"max_level": 2, "weights": [1, 100, 10000]}'
+    """
+    config = json.loads(text)
+    if not isinstance(config, dict):
+        raise argparse.ArgumentTypeError(
+            '{} is not a JSON object'.format(text))
+    return config
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Plays Goku engine configurations against each other')
+    parser.add_argument('--a', default='{"max_level": 2}', type=parse_engine,
+                        help='configuration of engine A, as a JSON object')
+    parser.add_argument('--b', default='{"max_level": 2}', type=parse_engine,
+                        help='configuration of engine B, as a JSON object')
+    parser.add_argument('--games', type=int, default=100)
+    parser.add_argument('--workers', type=int, default=None,
+                        help='processes to use (default: all cores)')
+    parser.add_argument('--openings', choices=('random', 'book'),
+                        default='random')
+    parser.add_argument('--opening-plies', type=int, default=2)
+    parser.add_argument('--max-moves', type=int, default=None)
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--size', type=int, default=BOARD_SIZE,
+                        help='board size of the games')
+    parser.add_argument('--games-output',
+                        help='JSON lines file to write every game to')
+    args = parser.parse_args()
+
+    games_output = open(args.games_output, 'w') if args.games_output else None
+    try:
+        statistics = run_match(args.a, args.b, args.games, args.workers,
+                               args.openings, args.opening_plies,
+                               args.max_moves, args.seed, games_output,
+                               args.size)
+    finally:
+        if games_output is not None:
+            games_output.close()
+    print(json.dumps(statistics, indent=2))
@@ -0,0 +1,355 @@
+import math
+import time
+import numpy as np
+from candidates import CandidateMoves
+from constants import MCTS_SIMULATIONS
+from constants import OPPONENT_WEIGHT
+from evaluation import new_evaluator
+
+# Exploration constant of the UCT formula
+EXPLORATION = 1.0
+
+# Heuristic score that makes a winning chance of about 73%, and the
+# temperature of the playout policy, in heuristic units
+SCORE_SCALE = 5000.0
+PLAYOUT_TEMPERATURE = 100.0
+
+# Movements played by the heuristic guided playouts
+PLAYOUT_DEPTH = 4
+
+# Candidate movements are closer than on the minimax, to keep the tree narrow
+MCTS_RADIUS = 1
+
+# Nodes allocated at once by the node store
+CHUNK_NODES = 4096
+
+# Proven results of a node, for the player who made its movement
+WON = 1
+LOST = -1
+
+
+class MonteCarloTreeSearch:
+    """
+        Monte Carlo tree search (UCT) for Goku, who is always the player to
+    move on the root. The tree lives in NumPy arrays indexed by node, with
+    the children of a node stored next to each other, so selection is one
+    vectorised UCT over a slice. Node values are the winning chances of the
+    player who made the node's movement.
+        Expanding a node scores all its children in one batched evaluation,
+    which also becomes their first visit, and the node is valued by a short
+    playout where each side samples its moves from the same batched scores.
+    Movements making five prove the node they lead to won, and its parent
+    lost, so those are not searched again.
+        The tree is kept between searches: when the new root is the old one
+    after Goku's movement and the opponent's reply, its subtree is reused.
+    """
+
+    def __init__(self, seed=None, weights=None,
+                 opponent_weight=OPPONENT_WEIGHT, playout_depth=PLAYOUT_DEPTH,
+                 exploration=EXPLORATION, evaluator='runs'):
+        self._random = np.random.RandomState(seed)
+        self._weights = weights
+        self._opponent_weight = opponent_weight
+        self._evaluator_kind = evaluator
+        self.playout_depth = playout_depth
+        self.exploration = exploration
+        self._root_board = None
+        self._new_tree()
+
+    def search(self, board, simulations=MCTS_SIMULATIONS, time_limit=None,
+               stop=None):
+        """
+            Runs the simulations (or, with a time limit in seconds, as many as
+        fit in it) from the board, with Goku to move, or until the stop
+        Event is set. Returns the number of simulations run.
+        """
+        self._set_root(board)
+        deadline = time.time() + time_limit if time_limit else None
+        runs = 0
+        while (runs < simulations if deadline is None
+               else time.time() < deadline):
+            if stop is not None and stop.is_set():
+                break
+            self._simulate()
+            runs += 1
+        return runs
+
+    def seed(self, seed):
+        """
+            Restarts the random generator of the playouts
+        """
+        self._random.seed(seed)
+
+    def root_statistics(self):
+        """
+            Movements of the root and their visits and wins
+        """
+        first, count = self._first_child[0], self._child_counts[0]
+        return (self._movements[first:first + count].copy(),
+                self._visits[first:first + count].copy(),
+                self._wins[first:first + count].copy())
+
+    def principal_variation(self):
+        """
+            The most visited line from the root, as positions
+        """
+        line = []
+        node = 0
+        while self._child_counts[node]:
+            first = self._first_child[node]
+            count = self._child_counts[node]
+            node = first + int(np.argmax(self._visits[first:first + count]))
+            line.append(self._root_board.position(int(self._movements[node])))
+        return line
+
+    def __len__(self):
+        return self._count
+
+    @staticmethod
+    def best_movement(movements, visits, wins):
+        """
+            The most visited movement (the robust choice) and its winning
+        chance
+        """
+        best = int(np.argmax(visits))
+        return int(movements[best]), float(wins[best] / visits[best])
+
+    def _new_tree(self):
+        self._movements = np.full(CHUNK_NODES, -1, dtype=np.int32)
+        self._visits = np.zeros(CHUNK_NODES)
+        self._wins = np.zeros(CHUNK_NODES)
+        self._first_child = np.zeros(CHUNK_NODES, dtype=np.int32)
+        self._child_counts = np.zeros(CHUNK_NODES, dtype=np.int32)
+        self._expanded = np.zeros(CHUNK_NODES, dtype=bool)
+        self._proven = np.zeros(CHUNK_NODES, dtype=np.int8)
+        self._count = 1
+
+    def _set_root(self, board):
+        """
+            Keeps the subtree of the board if it follows the last root by
+        Goku's movement and the opponent's reply, starts over otherwise
+        """
+        previous = self._root_board
+        self._root_board = board.copy()
+        self._board = board.copy()
+        self._evaluator = new_evaluator(self._evaluator_kind, self._board,
+                                        self._weights, self._opponent_weight)
+        self._candidates = CandidateMoves(self._board, MCTS_RADIUS)
+        self._moves = []
+        if previous is None or previous.size != board.size:
+            self._new_tree()
+            return
+        if previous == board:
+            return
+
+        node = 0
+        for symbol in ('G', 'X'):
+            played = board.mask(symbol) & ~previous.mask(symbol)
+            if (previous.mask(symbol) & ~board.mask(symbol) or
+                    played & (played - 1) or not played):
+                node = -1
+                break
+            node = self._child(node, played.bit_length() - 1)
+            if node < 0:
+                break
+        if node < 0 or len(board) != len(previous) + 2:
+            self._new_tree()
+        else:
+            self._reroot(node)
+
+    def _child(self, node, movement):
+        first, count = self._first_child[node], self._child_counts[node]
+        found = np.flatnonzero(self._movements[first:first + count] ==
+                               movement)
+        return int(first + found[0]) if len(found) else -1
+
+    def _reroot(self, root):
+        """
+            Copies the subtree of the node to the start of the store, children
+        still next to each other, dropping the rest of the tree
+        """
+        order = [root]
+        first_child = [0]
+        index = 0
+        while index < len(order):
+            node = order[index]
+            count = self._child_counts[node]
+            first_child.append(len(order) if count else 0)
+            if count:
+                first = self._first_child[node]
+                order.extend(range(first, first + count))
+            index += 1
+        order = np.array(order)
+        for name in ('_movements', '_visits', '_wins', '_child_counts',
+                     '_expanded', '_proven'):
+            array = getattr(self, name)
+            array[:len(order)] = array[order]
+        self._first_child[:len(order)] = first_child[1:]
+        self._count = len(order)
+
+    def _allocate(self, count):
+        """
+            Index of the first of count new nodes, growing the store when
+        needed
+        """
+        start = self._count
+        if start + count > len(self._movements):
+            extra = max(CHUNK_NODES, start + count - len(self._movements))
+            for name, fill in (('_movements', -1), ('_visits', 0),
+                               ('_wins', 0), ('_first_child', 0),
+                               ('_child_counts', 0), ('_expanded', False),
+                               ('_proven', 0)):
+                array = getattr(self, name)
+                setattr(self, name, np.concatenate(
+                    [array, np.full(extra, fill, dtype=array.dtype)]))
+        # Nodes dropped by a reroot may have left their data behind
+        self._child_counts[start:start + count] = 0
+        self._expanded[start:start + count] = False
+        self._proven[start:start + count] = 0
+        self._count += count
+        return start
+
+    def _simulate(self):
+        """
+            One simulation: selects a leaf by UCT, expands it, values it with
+        a playout and backs the value up the path
+        """
+        node = 0
+        path = [0]
+        player = 'G'
+        made = 0
+        # The root is searched even when proven, to find its best movement
+        while self._expanded[node] and (not self._proven[node] or not made):
+            if not self._child_counts[node]:
+                break
+            node = self._select(node)
+            self._make_move(int(self._movements[node]), player)
+            made += 1
+            path.append(node)
+            player = 'X' if player == 'G' else 'G'
+
+        if self._proven[node] and made:
+            value = 1.0 if self._proven[node] == WON else 0.0
+        else:
+            value = self._expand(node, player)
+            if value is None:
+                value = 1.0 - self._playout(player)
+        for _ in range(made):
+            self._unmake_move()
+
+        # Values alternate between the players along the path
+        for node in reversed(path):
+            self._visits[node] += 1
+            self._wins[node] += value
+            value = 1.0 - value
+
+    def _select(self, node):
+        first, count = self._first_child[node], self._child_counts[node]
+        visits = self._visits[first:first + count]
+        uct = (self._wins[first:first + count] / visits +
+               self.exploration *
+               np.sqrt(math.log(self._visits[node] + 1) / visits))
+        # Proven wins are always taken and proven losses avoided
+        proven = self._proven[first:first + count]
+        uct[proven == WON] = math.inf
+        uct[proven == LOST] = -math.inf
+        return first + int(np.argmax(uct))
+
+    def _expand(self, node, player):
+        """
+            Adds the children of the node, with the player to move, each one
+        visited once with its heuristic winning chance. Returns the node's
+        value when it is already decided (the board is full, or the player
+        wins right away, which proves the node lost), None otherwise.
+        """
+        self._expanded[node] = True
+        moves = self._candidates.moves()
+        if not moves:
+            return 0.5
+        chances = self._chances(moves, player)
+        wins = self._board.five_cells(player)
+        won = np.array([bool(wins >> move & 1) for move in moves])
+        chances[won] = 1.0
+
+        first = self._allocate(len(moves))
+        children = slice(first, first + len(moves))
+        self._first_child[node] = first
+        self._child_counts[node] = len(moves)
+        self._movements[children] = moves
+        self._visits[children] = 1
+        self._wins[children] = chances
+        self._proven[children] = np.where(won, WON, 0)
+        if won.any():
+            self._proven[node] = LOST
+            return 0.0
+        return None
+
+    def _playout(self, player):
+        """
+            Plays up to playout_depth movements from the search board, each
+        sampled from the batched heuristic scores, taking wins and blocking
+        fives first. Returns the winning chance of the player.
+        """
+        first = player
+        made = 0
+        value = None
+        for _ in range(self.playout_depth):
+            moves = self._candidates.moves()
+            if not moves:
+                value = 0.5
+                break
+            opponent = 'X' if player == 'G' else 'G'
+            wins = self._board.five_cells(player)
+            if wins:
+                value = 1.0 if player == first else 0.0
+                break
+            blocks = self._board.five_cells(opponent)
+            if blocks:
+                movement = blocks.bit_length() - 1
+            else:
+                movement = self._sample(moves, player)
+            self._make_move(movement, player)
+            made += 1
+            player = opponent
+
+        if value is None:
+            chance = float(winning_chance(self._evaluator.score()))
+            value = chance if first == 'G' else 1 - chance
+        for _ in range(made):
+            self._unmake_move()
+        return value
+
+    def _sample(self, moves, player):
+        scores = self._evaluator.score_moves(self._board, moves, player)
+        if player != 'G':
+            scores = -scores
+        weights = np.exp((scores - scores.max()) / PLAYOUT_TEMPERATURE)
+        return moves[self._random.choice(len(moves),
+                                         p=weights / weights.sum())]
+
+    def _chances(self, moves, player):
+        """
+            Winning chances of the player after each of the movements
+        """
+        chances = winning_chance(
+            self._evaluator.score_moves(self._board, moves, player))
+        return chances if player == 'G' else 1 - chances
+
+    def _make_move(self, movement, player):
+        self._board.place(movement, player)
+        self._evaluator.update(self._board, movement)
+        self._candidates.place(movement)
+        self._moves.append(movement)
+
+    def _unmake_move(self):
+        movement = self._moves.pop()
+        self._board.remove(movement)
+        self._evaluator.update(self._board, movement)
+        self._candidates.remove(movement)
+
+
+def winning_chance(score):
+    """
+        Winning chance of Goku (a number or an array) for heuristic scores
+    """
+    return 1 / (1 + np.exp(-np.clip(np.divide(score, SCORE_SCALE), -50, 50)))
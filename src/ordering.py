@@ -0,0 +1,116 @@
+# Priorities of the movements, above any history score
+TABLE_MOVE = 1 << 62
+WINNING_MOVE = 1 << 61
+BLOCKING_MOVE = 1 << 60
+KILLER_MOVE = 1 << 59
+
+# Killer movements kept per ply
+KILLER_SLOTS = 2
+
+
+class MoveOrdering:
+    """
+        Sorts the movements of a search node so that alpha-beta cuts off as
+    soon as possible: the best move from the transposition table, then the
+    ones winning or blocking a five, then the killer moves of the ply (moves
+    that caused a cutoff on siblings) and the rest by their history score.
+    The history survives between searches, being halved on each new one.
+    """
+
+    def __init__(self, cells):
+        self._cells = cells
+        self._history = {}
+        self._killers = []
+        self.cutoffs = 0
+        self.cutoff_indexes = []
+
+    def new_search(self):
+        self._killers = []
+        for scores in self._history.values():
+            for index in range(len(scores)):
+                scores[index] >>= 1
+        self.cutoffs = 0
+        self.cutoff_indexes = []
+
+    def state(self):
+        """
+            Copy of the history and the killer movements, so another search
+        (e.g. on a worker process) orders as this one would
+        """
+        return ({player: list(scores)
+                 for player, scores in self._history.items()},
+                [list(killers) for killers in self._killers])
+
+    def load(self, state):
+        history, killers = state
+        self._history = {player: list(scores)
+                         for player, scores in history.items()}
+        self._killers = [list(ply_killers) for ply_killers in killers]
+
+    def merge_history(self, history, base):
+        """
+            Adds what the history of another search, which started from the
+        'base' history of a state, gained on it
+        """
+        for player, scores in history.items():
+            own = self._history_of(player)
+            initial = base.get(player)
+            for movement, score in enumerate(scores):
+                own[movement] += score - (initial[movement] if initial
+                                          else 0)
+
+    def order(self, moves, board, ply, player, opponent, first=-1):
+        history = self._history_of(player)
+        killers = self._killers[ply] if ply < len(self._killers) else ()
+        wins = board.five_cells(player)
+        blocks = board.five_cells(opponent)
+
+        def priority(movement):
+            if movement == first:
+                return TABLE_MOVE
+            bit = 1 << movement
+            if wins & bit:
+                return WINNING_MOVE
+            if blocks & bit:
+                return BLOCKING_MOVE
+            if movement in killers:
+                return KILLER_MOVE + history[movement]
+            return history[movement]
+
+        return sorted(moves, key=priority, reverse=True)
+
+    def cutoff(self, movement, move_index, ply, depth, player):
+        """
+            Records the movement that caused a cutoff, at the given position
+        of the ordered movements
+        """
+        while len(self._killers) <= ply:
+            self._killers.append([])
+        killers = self._killers[ply]
+        if movement not in killers:
+            killers.insert(0, movement)
+            del killers[KILLER_SLOTS:]
+        self._history_of(player)[movement] += depth * depth
+
+        self.cutoffs += 1
+        while len(self.cutoff_indexes) <= move_index:
+            self.cutoff_indexes.append(0)
+        self.cutoff_indexes[move_index] += 1
+
+    def stats(self):
+        """
+            Cutoffs of the last search, and how many of them happened on the
+        first, second... movement tried
+        """
+        first = self.cutoff_indexes[0] if self.cutoff_indexes else 0
+        return {
+            'cutoffs': self.cutoffs,
+            'first_move_cutoffs': first,
+            'first_move_rate': first / self.cutoffs if self.cutoffs else 0.0,
+            'cutoff_indexes': list(self.cutoff_indexes)
+        }
+
+    def _history_of(self, player):
+        if player not in self._history:
+            self._history[player] = [0] * self._cells
+        return self._history[player]
@@ -0,0 +1,127 @@
+import argparse
+from functools import lru_cache
+import numpy as np
+
+# Cells on each side of the stone classified, enough to see any five
+# through it
+RADIUS = 4
+WINDOW = 2 * RADIUS + 1
+
+# Values of the cells of a window: the base-3 digits of its index. Off the
+# board cells are blocked like the opponent's stones.
+EMPTY = 0
+OWN = 1
+BLOCKED = 2
+
+# Digit weights of the window cells, the first cell being the lowest one
+POWERS = 3 ** np.arange(WINDOW)
+
+# Pattern classes of a stone along one line, from the weakest. A dead stone
+# can not make five on the line any more; the others are named after what
+# they threaten, so broken shapes (.GG.G.) fall in the same class as the
+# solid ones (.GGG..).
+NONE = 0
+ONE = 1
+TWO = 2
+OPEN_TWO = 3
+THREE = 4
+OPEN_THREE = 5
+FOUR = 6
+OPEN_FOUR = 7
+FIVE = 8
+
+CLASS_NAMES = ('none', 'one', 'two', 'open two', 'three', 'open three',
+               'four', 'open four', 'five')
+
+# Score of every stone of a pattern, by class. Each stone of a pattern
+# counts, so a four is worth four times its score on a line.
+PATTERN_SCORES = (0, 1, 10, 100, 100, 1000, 1000, 10000, 100000)
+
+# Class of the pattern a single stone threatens to make, by the class the
+# best cell to play next makes
+_THREATS = {OPEN_FOUR: OPEN_THREE, FOUR: THREE, OPEN_THREE: OPEN_TWO,
+            THREE: TWO}
+
+# Table used by the evaluators, built on first use or loaded from a file
+_table = None
+
+
+@lru_cache(maxsize=None)
+def classify(window):
+    """
+        Class of the pattern of the own stone in the middle of the window (a
+    tuple of WINDOW cell values) along its line
+    """
+    if _five(window):
+        return FIVE
+    empties = [cell for cell, value in enumerate(window) if value == EMPTY]
+    fives = [cell for cell in empties if _five(_fill(window, cell))]
+    if len(fives) > 1:
+        return OPEN_FOUR
+    if fives:
+        return FOUR
+    if not any(BLOCKED not in window[start:start + 5]
+               for start in range(RADIUS + 1)):
+        return NONE
+    best = max(classify(_fill(window, cell)) for cell in empties)
+    return _THREATS.get(best, ONE)
+
+
+def _fill(window, cell):
+    return window[:cell] + (OWN,) + window[cell + 1:]
+
+
+def _five(window):
+    """
+        Whether five own stones in a row go through the middle of the window
+    """
+    return any(all(value == OWN for value in window[start:start + 5])
+               for start in range(RADIUS + 1))
+
+
+def build_table():
+    """
+        Class of every window, by its base-3 index. Windows without an own
+    stone in the middle are not patterns and get NONE.
+    """
+    table = np.zeros(3 ** WINDOW, dtype=np.int8)
+    for index in range(len(table)):
+        window = tuple(index // 3 ** cell % 3 for cell in range(WINDOW))
+        if window[RADIUS] == OWN:
+            table[index] = classify(window)
+    return table
+
+
+def pattern_table():
+    """
+        The table of the evaluators, built the first time it is needed
+    """
+    global _table
+    if _table is None:
+        _table = build_table()
+    return _table
+
+
+def save_table(path, table=None):
+    np.save(path, pattern_table() if table is None else table)
+
+
+def load_table(path):
+    """
+        Loads a table written by save_table and makes the evaluators use it,
+    which saves building it on startup
+    """
+    global _table
+    table = np.load(path)
+    if table.shape != (3 ** WINDOW,) or table.dtype != np.int8:
+        raise ValueError('{} is not a pattern table'.format(path))
+    _table = table
+    return table
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Builds the pattern table of the evaluator')
+    parser.add_argument('output', help='.npy file to write the table to')
+    args = parser.parse_args()
+    save_table(args.output)
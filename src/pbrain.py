@@ -0,0 +1,203 @@
+import sys
+from bitboard import Bitboard
+from goku import Goku
+
+# Gomocup defaults, until the manager tells otherwise (milliseconds)
+TIMEOUT_TURN = 30000
+TIMEOUT_MATCH = 1000000000
+
+# Time kept back from every turn for the answer to reach the manager,
+# and the least time searched, when playing as fast as possible (seconds)
+TIME_RESERVE = 0.1
+MIN_TURN_TIME = 0.05
+
+# Share of the remaining match time given to one move
+MOVES_TO_GO = 10
+
+# Memory taken by the interpreter and everything but the transposition
+# table, and the table size when there is no memory limit (megabytes)
+MEMORY_OVERHEAD_MB = 64
+TABLE_SIZE_MB = 16
+
+ABOUT = 'name="Goku", version="1.0"'
+
+# Fields of the BOARD command
+OWN_STONE = '1'
+OPPONENT_STONE = '2'
+
+
+class Engine:
+    """
+        Gomocup (Piskvork) protocol front-end: reads the manager commands one
+    line at a time and returns the lines to answer. Own stones are Goku's
+    ('G') and the opponent's ones are 'X'. Coordinates are given as x,y,
+    i.e. column and row.
+        Goku searches with a time limit taken from the turn and match
+    timeouts, and its transposition table is sized to fit max_memory.
+    """
+
+    def __init__(self):
+        self.board = None
+        self.timeout_turn = TIMEOUT_TURN
+        self.timeout_match = TIMEOUT_MATCH
+        self.time_left = None
+        self.max_memory = 0
+        self._agent = None
+        self._table_size_mb = None
+        self._board_lines = None
+        self.finished = False
+
+    def handle(self, line):
+        """
+            Answer lines to the command
+        """
+        line = line.strip()
+        if self._board_lines is not None:
+            return self._board_line(line)
+        if not line:
+            return []
+        command, _, arguments = line.partition(' ')
+        handler = getattr(self, '_command_' + command.lower(), None)
+        if handler is None:
+            return ['UNKNOWN {}'.format(command)]
+        if self.board is None and command.upper() not in (
+                'START', 'RECTSTART', 'INFO', 'ABOUT', 'END'):
+            return ['ERROR no game was started']
+        try:
+            return handler(arguments.strip())
+        except ValueError as error:
+            return ['ERROR {}'.format(error)]
+
+    def turn_time(self):
+        """
+            Seconds to search the next move
+        """
+        limit = self.timeout_turn / 1000 if self.timeout_turn else 0
+        if self.timeout_match:
+            remaining = (self.time_left if self.time_left is not None
+                         else self.timeout_match)
+            limit = min(limit, remaining / 1000 / MOVES_TO_GO)
+        return max(limit - TIME_RESERVE, MIN_TURN_TIME)
+
+    def table_size_mb(self):
+        """
+            Transposition table size allowed by the memory limit
+        """
+        if not self.max_memory:
+            return TABLE_SIZE_MB
+        available = self.max_memory / 2 ** 20 - MEMORY_OVERHEAD_MB
+        return max(available, 1)
+
+    def _command_start(self, arguments):
+        size = int(arguments)
+        if size < 5:
+            raise ValueError('unsupported board size {}'.format(size))
+        self.board = Bitboard(size)
+        return ['OK']
+
+    def _command_restart(self, arguments):
+        self.board = Bitboard(self.board.size)
+        return ['OK']
+
+    def _command_rectstart(self, arguments):
+        width, height = (int(value) for value in arguments.split(','))
+        if width != height:
+            raise ValueError('rectangular boards are not supported')
+        return self._command_start(str(width))
+
+    def _command_info(self, arguments):
+        key, _, value = arguments.partition(' ')
+        if key == 'timeout_turn':
+            self.timeout_turn = int(value)
+        elif key == 'timeout_match':
+            self.timeout_match = int(value)
+        elif key == 'time_left':
+            self.time_left = int(value)
+        elif key == 'max_memory':
+            self.max_memory = int(value)
+        # Other keys (game_type, rule, folder...) do not change the play
+        return []
+
+    def _command_begin(self, arguments):
+        return [self._play()]
+
+    def _command_turn(self, arguments):
+        self._place(arguments, 'X')
+        return [self._play()]
+
+    def _command_takeback(self, arguments):
+        index = self._index(arguments)
+        if self.board.is_empty(index):
+            raise ValueError('no stone on {}'.format(arguments))
+        self.board.remove(index)
+        return ['OK']
+
+    def _command_board(self, arguments):
+        self.board = Bitboard(self.board.size)
+        self._board_lines = []
+        return []
+
+    def _board_line(self, line):
+        if line.upper() != 'DONE':
+            self._board_lines.append(line)
+            return []
+        lines, self._board_lines = self._board_lines, None
+        try:
+            for board_line in lines:
+                x, y, field = board_line.split(',')
+                symbol = 'G' if field.strip() == OWN_STONE else 'X'
+                self._place('{},{}'.format(x, y), symbol)
+        except ValueError as error:
+            return ['ERROR {}'.format(error)]
+        return [self._play()]
+
+    def _command_about(self, arguments):
+        return [ABOUT]
+
+    def _command_end(self, arguments):
+        self.finished = True
+        if self._agent is not None:
+            self._agent.close()
+        return []
+
+    def _play(self):
+        row, col = self._engine().next_move(self.board,
+                                            time_limit=self.turn_time())
+        self.board.place(self.board.index((row, col)), 'G')
+        return '{},{}'.format(col, row)
+
+    def _engine(self):
+        """
+            The agent, made again when the memory limit changes its table
+        """
+        size_mb = self.table_size_mb()
+        if self._agent is None or size_mb != self._table_size_mb:
+            self._agent = Goku(table_size_mb=size_mb)
+            self._table_size_mb = size_mb
+        return self._agent
+
+    def _index(self, coordinates):
+        x, y = (int(value) for value in coordinates.split(','))
+        if not self.board.contains((y, x)):
+            raise ValueError('{} is out of the board'.format(coordinates))
+        return self.board.index((y, x))
+
+    def _place(self, coordinates, symbol):
+        index = self._index(coordinates)
+        if not self.board.is_empty(index):
+            raise ValueError('{} is not empty'.format(coordinates))
+        self.board.place(index, symbol)
+
+
+def main(input_stream=sys.stdin, output_stream=sys.stdout):
+    engine = Engine()
+    for line in input_stream:
+        for answer in engine.handle(line):
+            output_stream.write(answer + '\n')
+            output_stream.flush()
+        if engine.finished:
+            break
+
+
+if __name__ == '__main__':
+    main()
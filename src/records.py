@@ -0,0 +1,101 @@
+import argparse
+import json
+from collections import namedtuple
+from bitboard import Bitboard
+from constants import BOARD_SIZE
+
+# Results of a game, for the player who moved first
+RESULTS = {'1-0': 1, '0-1': -1, '1/2': 0, '*': None}
+
+# Stones of the first and the second player on the record boards
+SYMBOLS = ('X', 'O')
+
+GameRecord = namedtuple('GameRecord', ('moves', 'result', 'size'))
+
+
+def format_move(position):
+    """
+        Move in the usual notation: column letter and row number from 1,
+    e.g. (7, 7) is 'h8'
+    """
+    row, col = position
+    return '{}{}'.format(chr(ord('a') + col), row + 1)
+
+
+def parse_move(text):
+    col = ord(text[0].lower()) - ord('a')
+    row = int(text[1:]) - 1
+    return row, col
+
+
+def format_record(record):
+    """
+        One line game record: board size, result and the moves, e.g.
+    '15 1-0 h8 i9 h9 h10 h7 h6 g8 j8 f8 e8 i8'
+    """
+    result = next(text for text, value in RESULTS.items()
+                  if value == record.result)
+    return ' '.join([str(record.size), result] +
+                    [format_move(move) for move in record.moves])
+
+
+def parse_record(line):
+    fields = line.split()
+    if len(fields) < 2 or fields[1] not in RESULTS:
+        raise ValueError('{!r} is not a game record'.format(line))
+    size = int(fields[0])
+    moves = [parse_move(field) for field in fields[2:]]
+    for row, col in moves:
+        if not (0 <= row < size and 0 <= col < size):
+            raise ValueError('{!r} has moves out of the board'.format(line))
+    return GameRecord(moves, RESULTS[fields[1]], size)
+
+
+def read_records(stream):
+    """
+        Yields the records of a stream one at a time, so an archive of any
+    size is never held in memory. Blank lines and '#' comments are skipped.
+    """
+    for line in stream:
+        line = line.strip()
+        if line and not line.startswith('#'):
+            yield parse_record(line)
+
+
+def write_record(stream, record):
+    stream.write(format_record(record) + '\n')
+
+
+def replay(record, plies=None):
+    """
+        Board after the first plies of the game (all of them by default),
+    with the stones of the first player as SYMBOLS[0]
+    """
+    board = Bitboard(record.size)
+    for ply, position in enumerate(record.moves[:plies]):
+        board.place(board.index(position), SYMBOLS[ply % 2])
+    return board
+
+
+def from_match(line, size=BOARD_SIZE):
+    """
+        Record of a game written by match.run_match, whose result is from
+    the point of view of engine A
+    """
+    game = json.loads(line)
+    result = game['result'] if game['a_first'] else -game['result']
+    return GameRecord([tuple(move) for move in game['moves']], result, size)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Converts the games written by match.py to records')
+    parser.add_argument('games', help='JSON lines file from match.py')
+    parser.add_argument('output', help='file to write the records to')
+    parser.add_argument('--size', type=int, default=BOARD_SIZE)
+    args = parser.parse_args()
+
+    with open(args.games) as games, open(args.output, 'w') as output:
+        for line in games:
+            if line.strip():
+                write_record(output, from_match(line, args.size))
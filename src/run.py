@@ -1,5 +1,11 @@
+import argparse
+from constants import BOARD_SIZE
 from gomoku import Gomoku
 
 if __name__ == '__main__':
-    game = Gomoku()
+    parser = argparse.ArgumentParser(description='Plays gomoku')
+    parser.add_argument('--size', type=int, default=BOARD_SIZE,
+                        help='number of rows (and columns) of the board')
+    args = parser.parse_args()
+    game = Gomoku(args.size)
     game.run()
@@ -0,0 +1,109 @@
+import json
+import time
+
+
+class SearchStats:
+    """
+        Opt-in record of what a search did: nodes per ply, leaf evaluations,
+    cutoffs (and on which movement they happened), transposition table
+    usage, branching factor, leaves extended by the quiescence search and
+    its nodes, time spent generating moves, evaluating and hashing, and the
+    principal variation. Goku only touches it when one is
+    given, so there is no cost otherwise.
+        Each call to start begins the record of a new move; to_dict and
+    write_json_line export the current one.
+    """
+
+    def __init__(self):
+        self.start()
+
+    def start(self):
+        self.nodes_per_ply = []
+        self.evaluations = 0
+        self.cutoffs = 0
+        self.cutoff_indexes = []
+        self.probes = 0
+        self.hits = 0
+        self.stores = 0
+        self.expanded = 0
+        self.generated = 0
+        self.quiescence_leaves = 0
+        self.quiescence_nodes = 0
+        self.generation_time = 0.0
+        self.evaluation_time = 0.0
+        self.hashing_time = 0.0
+        self.principal_variation = []
+        self.depth = 0
+        self.value = None
+        self._start = time.perf_counter()
+        self.total_time = 0.0
+
+    def node(self, ply, count=1):
+        while len(self.nodes_per_ply) <= ply:
+            self.nodes_per_ply.append(0)
+        self.nodes_per_ply[ply] += count
+
+    def evaluation(self, seconds, count=1):
+        self.evaluations += count
+        self.evaluation_time += seconds
+
+    def probe(self, hit):
+        self.probes += 1
+        if hit:
+            self.hits += 1
+
+    def store(self):
+        self.stores += 1
+
+    def generation(self, moves, seconds):
+        self.expanded += 1
+        self.generated += moves
+        self.generation_time += seconds
+
+    def quiescence(self, nodes):
+        self.quiescence_leaves += 1
+        self.quiescence_nodes += nodes
+
+    def hashing(self, seconds):
+        self.hashing_time += seconds
+
+    def cutoff(self, move_index):
+        self.cutoffs += 1
+        while len(self.cutoff_indexes) <= move_index:
+            self.cutoff_indexes.append(0)
+        self.cutoff_indexes[move_index] += 1
+
+    def finish(self, depth, value, principal_variation):
+        self.depth = depth
+        self.value = value
+        self.principal_variation = principal_variation
+        self.total_time = time.perf_counter() - self._start
+
+    def branching_factor(self):
+        return self.generated / self.expanded if self.expanded else 0.0
+
+    def to_dict(self):
+        return {
+            'depth': self.depth,
+            'value': self.value,
+            'nodes': sum(self.nodes_per_ply),
+            'nodes_per_ply': list(self.nodes_per_ply),
+            'evaluations': self.evaluations,
+            'cutoffs': self.cutoffs,
+            'cutoff_indexes': list(self.cutoff_indexes),
+            'table_probes': self.probes,
+            'table_hits': self.hits,
+            'table_stores': self.stores,
+            'branching_factor': self.branching_factor(),
+            'quiescence_leaves': self.quiescence_leaves,
+            'quiescence_nodes': self.quiescence_nodes,
+            'generation_time': self.generation_time,
+            'evaluation_time': self.evaluation_time,
+            'hashing_time': self.hashing_time,
+            'total_time': self.total_time,
+            'principal_variation': [list(position) for position
+                                    in self.principal_variation]
+        }
+
+    def write_json_line(self, output):
+        output.write(json.dumps(self.to_dict()) + '\n')
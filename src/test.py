@@ -1,6 +1,29 @@
+import io
+import json
+import os
+import tempfile
+import time
 import unittest
 
+import numpy as np
+
+import analysis
+import benchmark
 import goku
+import match
+import patterns
+import pbrain
+import records
+import utils
+from bitboard import Bitboard
+from book import OpeningBook, build_book, symmetries
+from candidates import CandidateMoves
+from constants import INITIAL_BOARD, SEARCH_DEPTH, WIN_SCORE
+from evaluation import Evaluator, PatternEvaluator
+from mcts import MonteCarloTreeSearch
+from stats import SearchStats
+from threats import ThreatSolver
+from transposition import TranspositionTable, EXACT, LOWER
 from gomoku import Gomoku
 
 
@@ -237,5 +260,873 @@ class GokuTest(unittest.TestCase):
         self.assertEqual(quartets, 2)
 
 
+class BitboardTest(unittest.TestCase):
+    def setUp(self):
+        self.board = np.copy(INITIAL_BOARD)
+        for position in [(0, 0), (1, 1), (2, 2), (3, 3), (7, 7), (7, 8),
+                         (7, 9), (14, 14), (13, 14), (0, 14), (1, 13)]:
+            self.board[position] = 'X'
+        for position in [(5, 5), (5, 6), (6, 5), (14, 0), (13, 1)]:
+            self.board[position] = 'G'
+
+    def test_array_round_trip(self):
+        bitboard = Bitboard.from_array(self.board)
+        self.assertTrue((bitboard.to_array() == self.board).all())
+        self.assertEqual(len(bitboard), 16)
+
+    def test_count_matches_find(self):
+        bitboard = Bitboard.from_array(self.board)
+        for symbol in ('X', 'G'):
+            for pattern in (2, 3, 4):
+                self.assertEqual(bitboard.count(symbol, pattern),
+                                 utils.find(symbol, pattern, self.board))
+
+    def test_runs_do_not_wrap_lines(self):
+        bitboard = Bitboard()
+        bitboard.place(bitboard.index((0, 14)), 'X')
+        bitboard.place(bitboard.index((1, 0)), 'X')
+        self.assertEqual(bitboard.count('X', 2), 0)
+
+    def test_five_cells(self):
+        bitboard = Bitboard()
+        for col in (0, 1, 3, 4):
+            bitboard.place(bitboard.index((2, col)), 'X')
+        for row in range(10, 14):
+            bitboard.place(bitboard.index((row, 14)), 'X')
+        bitboard.place(bitboard.index((14, 14)), 'G')
+        self.assertEqual(bitboard.five_cells('X'),
+                         (1 << bitboard.index((2, 2))) |
+                         (1 << bitboard.index((9, 14))))
+        self.assertEqual(bitboard.five_cells('G'), 0)
+
+    def test_open_cells(self):
+        bitboard = Bitboard()
+        for col in (5, 6, 7):
+            bitboard.place(bitboard.index((7, col)), 'G')
+        self.assertEqual(bitboard.open_cells('G', 3),
+                         (1 << bitboard.index((7, 4))) |
+                         (1 << bitboard.index((7, 8))))
+        bitboard.place(bitboard.index((10, 5)), 'G')
+        bitboard.place(bitboard.index((10, 6)), 'G')
+        self.assertTrue(bitboard.open_cells('G', 2) >>
+                        bitboard.index((10, 7)) & 1)
+        # A blocked three threatens no open four, nor does one on the edge
+        bitboard.place(bitboard.index((7, 4)), 'X')
+        for row in range(3):
+            bitboard.place(bitboard.index((row, 14)), 'G')
+        self.assertEqual(bitboard.open_cells('G', 3), 0)
+
+    def test_winner(self):
+        game = Gomoku()
+        for col in range(4):
+            game._mark_board(player=1, position=(3, 10 - col))
+            self.assertIsNone(game._game_finished((3, 10 - col)))
+            self.assertIsNone(game._board.winner())
+
+        game._mark_board(player=1, position=(3, 6))
+        self.assertEqual(game._game_finished((3, 6)), 'O')
+        self.assertEqual(game._game_finished((3, 8)), 'O')
+        self.assertEqual(game._board.winner(), 'O')
+
+    def test_is_five(self):
+        bitboard = Bitboard()
+        for row, col in [(4, 14), (5, 13), (6, 12), (7, 11), (9, 9)]:
+            bitboard.place(bitboard.index((row, col)), 'X')
+        self.assertFalse(bitboard.is_five(bitboard.index((7, 11))))
+
+        bitboard.place(bitboard.index((8, 10)), 'X')
+        self.assertTrue(bitboard.is_five(bitboard.index((8, 10))))
+        self.assertEqual(bitboard.run_length(bitboard.index((4, 14)),
+                                             bitboard.geometry.stride - 1), 6)
+
+
+class EvaluatorTest(unittest.TestCase):
+    def test_matches_heuristic(self):
+        agent = goku.Goku()
+        board = Bitboard()
+        evaluator = Evaluator(board)
+        rng = np.random.RandomState(0)
+        played = []
+        for turn in range(60):
+            index = int(rng.choice(list(board.empty_cells())))
+            board.place(index, 'GX'[turn % 2])
+            evaluator.update(board, index)
+            played.append(index)
+            self.assertEqual(evaluator.score(), agent.heuristic(board))
+
+        for index in reversed(played):
+            board.remove(index)
+            evaluator.update(board, index)
+            self.assertEqual(evaluator.score(), agent.heuristic(board))
+
+    def test_batch_matches_heuristic(self):
+        agent = goku.Goku()
+        board = Bitboard()
+        rng = np.random.RandomState(4)
+        cells = list(board.empty_cells())
+        rng.shuffle(cells)
+        for turn, index in enumerate(cells[:40]):
+            board.place(index, 'GX'[turn % 2])
+
+        evaluator = Evaluator(board)
+        moves = list(board.empty_cells())
+        for mover in ('G', 'X'):
+            scores = evaluator.score_moves(board, moves, mover)
+            for index, score in zip(moves, scores):
+                board.place(index, mover)
+                self.assertEqual(score, agent.heuristic(board))
+                board.remove(index)
+
+
+class PatternEvaluatorTest(unittest.TestCase):
+    def classify(self, line):
+        values = {'.': patterns.EMPTY, 'G': patterns.OWN,
+                  'X': patterns.BLOCKED}
+        return patterns.classify(tuple(values[cell] for cell in line))
+
+    def test_classes(self):
+        self.assertEqual(self.classify('..GGGG...'), patterns.OPEN_FOUR)
+        self.assertEqual(self.classify('.XGGGG...'), patterns.FOUR)
+        self.assertEqual(self.classify('..GG.GG..'), patterns.FOUR)
+        self.assertEqual(self.classify('...GGG...'), patterns.OPEN_THREE)
+        self.assertEqual(self.classify('..G.GG...'), patterns.OPEN_THREE)
+        self.assertEqual(self.classify('..XGGG..X'), patterns.THREE)
+        self.assertEqual(self.classify('X...G...X'), patterns.ONE)
+        self.assertEqual(self.classify('XXX.G.XXX'), patterns.NONE)
+
+        # Only the four with both ends open gets the open four score
+        board = Bitboard()
+        for col in range(3, 7):
+            board.place(board.index((7, col)), 'G')
+        open_four = PatternEvaluator(board, opponent_weight=0).score()
+        board.place(board.index((7, 2)), 'X')
+        four = PatternEvaluator(board, opponent_weight=0).score()
+        self.assertGreater(open_four, 4 * four)
+
+    def test_incremental(self):
+        for size in (9, 15):
+            board = Bitboard(size)
+            evaluator = PatternEvaluator(board)
+            rng = np.random.RandomState(size)
+            for turn in range(size * 3):
+                index = int(rng.choice(list(board.empty_cells())))
+                board.place(index, 'GX'[turn % 2])
+                evaluator.update(board, index)
+                self.assertAlmostEqual(evaluator.score(),
+                                       PatternEvaluator(board).score())
+
+            moves = list(board.empty_cells())
+            for mover in ('G', 'X'):
+                scores = evaluator.score_moves(board, moves, mover)
+                for index, score in zip(moves, scores):
+                    board.place(index, mover)
+                    self.assertAlmostEqual(score,
+                                           PatternEvaluator(board).score())
+                    board.remove(index)
+
+    def test_table_file(self):
+        table = patterns.pattern_table()
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'patterns.npy')
+            patterns.save_table(path)
+            np.testing.assert_array_equal(patterns.load_table(path), table)
+            np.save(path, table[:10])
+            with self.assertRaises(ValueError):
+                patterns.load_table(path)
+
+    def test_goku_blocks_open_three(self):
+        board = Bitboard()
+        for row in range(5, 8):
+            board.place(board.index((row, 7)), 'X')
+        board.place(board.index((6, 8)), 'G')
+        board.place(board.index((8, 9)), 'G')
+        for engine in ('minimax', 'mcts'):
+            agent = goku.Goku(seed=0, evaluator='patterns', threat_nodes=0,
+                              engine=engine)
+            self.assertIn(agent.next_move(board, max_level=2),
+                          [(3, 7), (4, 7), (8, 7), (9, 7)])
+
+
+class CandidateMovesTest(unittest.TestCase):
+    def test_empty_board(self):
+        board = Bitboard()
+        self.assertEqual(CandidateMoves(board).moves(),
+                         [board.index((7, 7))])
+
+    def test_incremental(self):
+        board = Bitboard()
+        candidates = CandidateMoves(board, radius=1)
+        rng = np.random.RandomState(2)
+        played = []
+        for turn in range(30):
+            index = int(rng.choice(list(board.empty_cells())))
+            board.place(index, 'GX'[turn % 2])
+            candidates.place(index)
+            played.append(index)
+            self.assertEqual(sorted(candidates.moves()),
+                             sorted(CandidateMoves(board, 1).moves()))
+
+        for index in reversed(played[1:]):
+            board.remove(index)
+            candidates.remove(index)
+            self.assertEqual(sorted(candidates.moves()),
+                             sorted(CandidateMoves(board, 1).moves()))
+        self.assertEqual(len(candidates), 8)
+
+
+class ThreatSolverTest(unittest.TestCase):
+    def setUp(self):
+        self.solver = ThreatSolver()
+        self.board = Bitboard()
+
+    def place(self, symbol, positions):
+        for position in positions:
+            self.board.place(self.board.index(position), symbol)
+
+    def test_vcf(self):
+        self.place('G', [(7, 7), (7, 8), (7, 9), (8, 10), (9, 10), (10, 10)])
+        self.place('X', [(7, 6), (11, 10), (0, 0), (0, 1), (1, 0), (2, 2)])
+        self.assertEqual(self.solver.vcf(self.board), [(7, 10)])
+
+        self.place('X', [(7, 10)])
+        self.assertIsNone(self.solver.vcf(self.board))
+
+    def test_vcf_sequence(self):
+        self.place('G', [(3, 3), (3, 4), (3, 5), (4, 6), (5, 6)])
+        self.place('X', [(3, 2), (12, 11), (8, 11), (0, 0), (1, 1)])
+        line = self.solver.vcf(self.board)
+        self.assertEqual(line[:2], [(3, 6), (3, 7)])
+        self.assertIn(line[2], [(2, 6), (6, 6)])
+        for move, symbol in zip(line, 'GX' * len(line)):
+            self.assertTrue(self.board.is_empty(self.board.index(move)))
+            self.place(symbol, [move])
+        self.assertEqual(bin(self.board.five_cells('G')).count('1'), 2)
+
+    def test_opponent_four_first(self):
+        self.place('G', [(7, 7), (7, 8), (7, 9)])
+        self.place('X', [(0, 0), (0, 1), (0, 2), (0, 3), (5, 5)])
+        self.assertIsNone(self.solver.vcf(self.board))
+        self.assertEqual(self.solver.vcf(self.board, 'X', 'G'), [(0, 4)])
+
+    def test_goku_plays_forced_win(self):
+        self.place('G', [(7, 7), (7, 8), (7, 9), (8, 10), (9, 10)])
+        self.place('X', [(7, 6), (11, 10), (0, 0), (0, 1), (1, 0)])
+        self.assertIsNotNone(self.solver.vct(self.board))
+        position = goku.Goku().next_move(self.board, max_level=1)
+        self.assertIn(position, [(7, 10), (10, 10), (6, 10), (7, 11)])
+
+
+class OpeningBookTest(unittest.TestCase):
+    def setUp(self):
+        handle, self.path = tempfile.mkstemp()
+        os.close(handle)
+        build_book(self.path, plies=3, max_level=1, replies_radius=2)
+        self.book = OpeningBook(self.path)
+
+    def tearDown(self):
+        self.book.close()
+        os.remove(self.path)
+
+    def test_lookup(self):
+        board = Bitboard()
+        self.assertEqual(self.book.lookup(board), (7, 7))
+        self.assertEqual(goku.Goku(book=self.book).next_move(board), (7, 7))
+
+        # Openings off the centre, within the radius, are on the book too
+        for position in ((7, 7), (6, 8), (5, 5), (9, 7)):
+            opening = Bitboard()
+            opening.place(opening.index(position), 'X')
+            self.assertIsNotNone(self.book.lookup(opening))
+        opening = Bitboard()
+        opening.place(opening.index((4, 7)), 'X')
+        self.assertIsNone(self.book.lookup(opening))
+
+        board.place(board.index((7, 7)), 'G')
+        board.place(board.index((6, 9)), 'X')
+        self.assertIsNone(self.book.lookup(Bitboard(19)))
+        position = self.book.lookup(board)
+        self.assertTrue(board.is_empty(board.index(position)))
+
+        # Symmetric positions get the symmetric answer
+        for transform in symmetries(15):
+            symmetric = Bitboard()
+            symmetric.place(symmetric.index(transform(7, 7)), 'G')
+            symmetric.place(symmetric.index(transform(6, 9)), 'X')
+            self.assertEqual(self.book.lookup(symmetric),
+                             transform(*position))
+
+
+class TranspositionTableTest(unittest.TestCase):
+    def setUp(self):
+        self.table = TranspositionTable(size_mb=0.001)
+
+    def test_store_and_probe(self):
+        self.assertIsNone(self.table.probe(12345))
+        self.table.store(12345, 3, 1.5, EXACT, 42)
+        self.assertEqual(self.table.probe(12345), (3, 1.5, EXACT, 42))
+
+    def test_replacement(self):
+        buckets = self.table._bucket_mask + 1
+        deep, shallow, other = 7, 7 + buckets, 7 + 2 * buckets
+        self.table.store(deep, 5, 1.0, EXACT)
+        self.table.store(shallow, 1, 2.0, LOWER)
+        self.table.store(other, 2, 3.0, EXACT)
+        # The deep entry stays, the always replace slot takes the newest
+        self.assertIsNotNone(self.table.probe(deep))
+        self.assertIsNone(self.table.probe(shallow))
+        self.assertIsNotNone(self.table.probe(other))
+
+        # Entries from older searches give place to new ones
+        self.table.new_search()
+        self.table.store(shallow, 1, 2.0, LOWER)
+        self.assertIsNone(self.table.probe(deep))
+        self.assertLessEqual(len(self.table), 2 * buckets)
+
+    def test_save_and_load(self):
+        agent = goku.Goku(seed=7, table_size_mb=1)
+        board = Bitboard()
+        board.place(board.index((7, 7)), 'X')
+        agent.minimax(board, max_level=2)
+        table = agent._transposition_table
+        key = table.hash_key(board)
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'table.gtt')
+            agent.save_table(path)
+            loaded = TranspositionTable.load(path)
+            smaller = TranspositionTable.load(path, size_mb=0.5)
+            other = TranspositionTable(seed=8)
+            with self.assertRaises(ValueError):
+                other.merge_file(path)
+            merged = TranspositionTable(seed=7, size_mb=1)
+            merged.merge_file(path)
+
+        self.assertEqual(loaded.seed, 7)
+        self.assertEqual(len(loaded), len(table))
+        self.assertEqual(loaded.hash_key(board), key)
+        for copy in (loaded, smaller, merged):
+            self.assertEqual(copy.probe(key), table.probe(key))
+
+        # A warm agent answers the root from the table
+        warm = goku.Goku(table=loaded)
+        self.assertEqual(warm.minimax(board, max_level=2)[0],
+                         table.probe(key)[1])
+        self.assertEqual(warm._nodes, 1)
+
+
+class SearchTest(unittest.TestCase):
+    def setUp(self):
+        self.agent = goku.Goku()
+        self.board = Bitboard()
+        for position, symbol in [((7, 7), 'X'), ((7, 8), 'G'), ((8, 8), 'X')]:
+            self.board.place(self.board.index(position), symbol)
+
+    def test_minimax_restores_board(self):
+        before = self.board.to_array()
+        self.agent.minimax(self.board, max_level=2)
+        self.assertTrue((self.board.to_array() == before).all())
+        self.assertTrue((self.agent._board.to_array() == before).all())
+        self.assertEqual(self.agent._moves, [])
+
+    def test_numpy_board(self):
+        # The public search accepts the array of the game too
+        array = self.board.to_array()
+        self.assertEqual(self.agent.minimax(array, max_level=2),
+                         self.agent.minimax(self.board, max_level=2))
+        positions = self.agent.all_movement_possibilities(array)
+        self.assertEqual(sorted(positions), sorted(
+            self.agent.all_movement_possibilities(self.board)))
+        # Positions, which index the array
+        self.assertIn((6, 6), positions)
+        self.assertTrue(all(array[position] == '.'
+                            for position in positions))
+        self.assertEqual(self.agent.all_movement_possibilities(
+            Bitboard().to_array()), [(7, 7)])
+
+    def test_incremental_hash(self):
+        table = self.agent._transposition_table
+        self.agent.minimax(self.board, max_level=1)
+        key = self.agent._hash_key
+        self.assertEqual(key, table.hash_key(self.board, 'G'))
+
+        index = self.board.index((6, 6))
+        self.agent._make_move(index, 'G')
+        self.assertEqual(self.agent._hash_key,
+                         table.hash_key(self.agent._board, 'X'))
+        self.agent._unmake_move()
+        self.assertEqual(self.agent._hash_key, key)
+
+    def test_minimax_value(self):
+        def reference(board, player, level):
+            if level == 0:
+                return self.agent.heuristic(board)
+            values = []
+            for index in list(board.empty_cells()):
+                board.place(index, player)
+                if board.is_five(index):
+                    score = WIN_SCORE - (4 - level)
+                    values.append(score if player == 'G' else -score)
+                else:
+                    values.append(reference(board, 'XG'[player == 'X'],
+                                            level - 1))
+                board.remove(index)
+            return max(values) if player == 'G' else min(values)
+
+        rng = np.random.RandomState(1)
+        board = Bitboard()
+        cells = list(board.empty_cells())
+        rng.shuffle(cells)
+        for turn, index in enumerate(cells[:-8]):
+            board.place(index, 'GX'[turn % 2])
+
+        for player in ('G', 'X', 'G'):
+            expected = reference(board, player, 3)
+            value, movement = self.agent.minimax(board, current_player=player,
+                                                 max_level=3)
+            self.assertEqual(value, expected)
+            self.assertTrue(board.is_empty(board.index(movement)))
+
+    def test_aspiration_windows(self):
+        for level in (3, 4):
+            agent = goku.Goku(seed=1, threat_nodes=0)
+            value, position, depth = agent._iterative_deepening(
+                self.board, level, time_limit=60)
+            self.assertEqual(depth, level)
+            self.assertEqual(value, goku.Goku(seed=1).minimax(
+                self.board, max_level=level)[0])
+
+    def test_batch_frontier(self):
+        self.board.place(self.board.index((6, 6)), 'G')
+        for level in (1, 2, 3):
+            batched = goku.Goku(seed=5, batch_frontier=True).minimax(
+                self.board, max_level=level)
+            serial = goku.Goku(seed=5, batch_frontier=False).minimax(
+                self.board, max_level=level)
+            self.assertEqual(batched[0], serial[0])
+        # Batched by default only without the quiescence search
+        self.assertFalse(goku.Goku()._batch_frontier)
+        self.assertTrue(goku.Goku(quiescence_nodes=0)._batch_frontier)
+
+    def test_quiescence(self):
+        # Goku wins by threats beyond the horizon of a 1 ply search
+        board = benchmark.corpus_board('middlegame_spread')
+        stats = SearchStats()
+        agent = goku.Goku(seed=0, threat_nodes=0, stats=stats)
+        self.assertEqual(agent.next_move(board, max_level=1), (6, 7))
+        self.assertGreater(stats.value, WIN_SCORE / 2)
+        self.assertGreater(stats.quiescence_leaves, 0)
+        self.assertGreater(stats.quiescence_nodes, 0)
+        self.assertLess(goku.Goku(seed=0, threat_nodes=0,
+                                  quiescence_nodes=0).minimax(
+                                      board, max_level=1)[0], WIN_SCORE / 2)
+
+        for name in ('middlegame', 'tactical_open_three'):
+            board = benchmark.corpus_board(name)
+            batched = goku.Goku(seed=5, batch_frontier=True).minimax(
+                board, max_level=2)
+            serial = goku.Goku(seed=5, batch_frontier=False).minimax(
+                board, max_level=2)
+            self.assertEqual(batched[0], serial[0])
+
+    def test_ordering(self):
+        for col in range(8, 12):
+            self.board.place(self.board.index((6, col)), 'X')
+        for row in range(9, 13):
+            self.board.place(self.board.index((row, 8)), 'G')
+        self.agent.minimax(self.board, max_level=2)
+
+        moves = self.agent._search_moves('G')
+        self.assertEqual(moves[0], self.board.index((13, 8)))
+        self.assertEqual(set(moves[1:3]), {self.board.index((6, 7)),
+                                           self.board.index((6, 12))})
+        self.assertGreater(self.agent.cutoff_stats()['cutoffs'], 0)
+
+    def test_parallel_search(self):
+        self.board.place(self.board.index((6, 6)), 'G')
+        serial = goku.Goku(seed=3)
+        parallel = goku.Goku(seed=3, workers=2)
+        try:
+            for level in (2, 3):
+                serial._start_search(self.board, 'G')
+                parallel._start_search(self.board, 'G')
+                self.assertEqual(parallel._search_root(level),
+                                 serial._search_root(level))
+        finally:
+            parallel.close()
+
+    def test_parallel_search_nodes(self):
+        # The workers start from the entries and the ordering of the search,
+        # so they search about as many nodes as the serial one
+        board = benchmark.corpus_board('middlegame')
+        serial = goku.Goku(seed=0, threat_nodes=0)
+        parallel = goku.Goku(seed=0, threat_nodes=0, workers=2)
+        try:
+            for level in (1, 2, 3):
+                serial.next_move(board, max_level=level)
+                parallel.next_move(board, max_level=level)
+            self.assertGreater(parallel._nodes, serial._nodes / 2)
+            self.assertLess(parallel._nodes, serial._nodes * 3 / 2)
+        finally:
+            parallel.close()
+
+    def test_terminal_nodes(self):
+        agent = goku.Goku(threat_nodes=0)
+        for row in range(9, 13):
+            self.board.place(self.board.index((row, 6)), 'X')
+        self.board.place(self.board.index((8, 6)), 'G')
+        self.assertEqual(agent.next_move(self.board, max_level=2), (13, 6))
+
+        for col in range(9, 13):
+            self.board.place(self.board.index((2, col)), 'G')
+        value, position = agent.minimax(self.board, max_level=3)
+        self.assertIn(position, [(2, 8), (2, 13)])
+        self.assertEqual(value, WIN_SCORE - 1)
+
+    def test_stats(self):
+        stats = SearchStats()
+        agent = goku.Goku(threat_nodes=0, stats=stats)
+        position = agent.next_move(self.board, max_level=3)
+        record = stats.to_dict()
+        self.assertEqual(record['depth'], 3)
+        self.assertEqual(record['principal_variation'][0], list(position))
+        self.assertEqual(len(record['principal_variation']), 3)
+        self.assertEqual(record['nodes_per_ply'][0], 1)
+        self.assertEqual(record['nodes'] + record['quiescence_nodes'],
+                         agent._nodes)
+        self.assertEqual(record['cutoffs'],
+                         agent.cutoff_stats()['cutoffs'])
+        self.assertGreater(record['evaluations'], 0)
+        self.assertGreater(record['branching_factor'], 1)
+        self.assertEqual(json.loads(json.dumps(record)), record)
+
+    def test_hashing_time(self):
+        # The root key, and the updates on both making and unmaking moves
+        stats = SearchStats()
+        agent = goku.Goku(threat_nodes=0, stats=stats)
+        agent._start_search(self.board, 'G')
+        times = [stats.hashing_time]
+        agent._make_move(agent._search_moves('G')[0], 'G')
+        times.append(stats.hashing_time)
+        agent._unmake_move()
+        times.append(stats.hashing_time)
+        self.assertTrue(0 < times[0] < times[1] < times[2])
+
+    def test_time_limit(self):
+        start = time.time()
+        position = self.agent.next_move(self.board, time_limit=0.5)
+        self.assertLess(time.time() - start, 1.5)
+        self.assertTrue(self.board.is_empty(self.board.index(position)))
+        self.assertEqual(self.agent._moves, [])
+
+    def test_board_sizes(self):
+        agent = goku.Goku(threat_nodes=0)
+        for size in (19, 9, 15):
+            board = Bitboard(size)
+            for col in range(size - 4, size):
+                board.place(board.index((size - 1, col)), 'X')
+            board.place(board.index((0, 0)), 'G')
+            self.assertEqual(agent.next_move(board, max_level=2),
+                             (size - 1, size - 5))
+            self.assertEqual(agent._transposition_table.size, size)
+            self.assertEqual(agent.heuristic(board.to_array()),
+                             agent.heuristic(board))
+        self.assertEqual(Gomoku(board_size=19)._board.to_array().shape,
+                         (19, 19))
+
+    def test_ponder(self):
+        agent = goku.Goku(threat_nodes=0)
+        position = agent.next_move(self.board, max_level=2)
+        self.board.place(self.board.index(position), 'G')
+        reply = agent.ponder(self.board, max_level=2)
+        agent._ponder_thread.join()
+        pondered = agent._pondered[1]
+
+        self.board.place(self.board.index(reply), 'X')
+        self.assertEqual(agent.next_move(self.board, max_level=2),
+                         pondered[1])
+        self.assertIsNone(agent._ponder_thread)
+
+    def test_stop_pondering(self):
+        agent = goku.Goku(threat_nodes=0)
+        reply = agent.ponder(self.board, max_level=8)
+        self.assertTrue(self.board.is_empty(self.board.index(reply)))
+        time.sleep(0.1)
+        start = time.time()
+        agent.stop_pondering()
+        self.assertLess(time.time() - start, 0.5)
+        self.assertIsNone(agent._pondered)
+
+        # A different reply is searched as usual
+        self.board.place(self.board.index((9, 9)), 'X')
+        position = agent.next_move(self.board, max_level=1)
+        self.assertTrue(self.board.is_empty(self.board.index(position)))
+        self.assertEqual(agent._moves, [])
+
+    def test_stop_pondering_workers(self):
+        board = benchmark.corpus_board('middlegame_spread')
+        agent = goku.Goku(seed=0, threat_nodes=0, workers=2)
+        try:
+            agent.ponder(board, max_level=5)
+            # Waits for the root movements to be sent to the workers
+            start = time.time()
+            while agent._pool is None and time.time() - start < 30:
+                time.sleep(0.05)
+            time.sleep(0.2)
+            agent.stop_pondering()
+
+            # The cancelled tasks do not hold up the next search
+            start = time.time()
+            agent.next_move(board, time_limit=0.3)
+            self.assertLess(time.time() - start, 3)
+        finally:
+            agent.close()
+
+    def test_seeded_hash(self):
+        first = goku.Goku(seed=42)._transposition_table
+        second = goku.Goku(seed=42)._transposition_table
+        self.assertEqual(first.hash_key(self.board),
+                         second.hash_key(self.board))
+        self.assertNotEqual(first.hash_key(self.board, 'G'),
+                            first.hash_key(self.board, 'X'))
+
+
+class MonteCarloTreeSearchTest(unittest.TestCase):
+    def setUp(self):
+        self.tree = MonteCarloTreeSearch(seed=0)
+        self.board = Bitboard()
+        for position, symbol in [((7, 7), 'X'), ((7, 8), 'G'), ((8, 8), 'X'),
+                                 ((6, 6), 'G')]:
+            self.board.place(self.board.index(position), symbol)
+
+    def best_position(self):
+        movement, _ = self.tree.best_movement(*self.tree.root_statistics())
+        return self.board.position(movement)
+
+    def test_wins_and_blocks(self):
+        for row in range(9, 13):
+            self.board.place(self.board.index((row, 6)), 'X')
+        self.board.place(self.board.index((8, 6)), 'G')
+        self.tree.search(self.board, simulations=200)
+        self.assertEqual(self.best_position(), (13, 6))
+
+        for col in range(9, 13):
+            self.board.place(self.board.index((2, col)), 'G')
+        self.tree.search(self.board, simulations=50)
+        self.assertIn(self.best_position(), [(2, 8), (2, 13)])
+        self.assertGreater(self.tree.root_statistics()[2].max(), 49)
+
+    def test_tree_reuse(self):
+        self.tree.search(self.board, simulations=300)
+        line = self.tree.principal_variation()
+        self.assertGreaterEqual(len(line), 2)
+        for position, symbol in zip(line[:2], 'GX'):
+            self.board.place(self.board.index(position), symbol)
+        kept = self.tree._visits[self.tree._child(
+            self.tree._child(0, self.board.index(line[0])),
+            self.board.index(line[1]))]
+
+        self.tree.search(self.board, simulations=0)
+        self.assertEqual(self.tree._visits[0], kept)
+        movements, visits, _ = self.tree.root_statistics()
+        self.assertTrue(all(self.board.is_empty(int(movement))
+                            for movement in movements))
+        # Every visit but the first one from the parent and the expansion
+        # went on to a child, which was visited once when added
+        self.assertEqual(visits.sum(), kept - 2 + len(movements))
+
+        # A position that does not follow the tree starts a new one
+        self.board.place(self.board.index((0, 0)), 'X')
+        self.tree.search(self.board, simulations=0)
+        self.assertEqual(len(self.tree), 1)
+
+    def test_goku_engine(self):
+        for workers in (1, 2):
+            agent = goku.Goku(seed=4, threat_nodes=0, engine='mcts',
+                              simulations=100, workers=workers)
+            try:
+                position = agent.next_move(self.board)
+            finally:
+                agent.close()
+            self.assertTrue(self.board.is_empty(self.board.index(position)))
+        with self.assertRaises(ValueError):
+            goku.Goku(engine='negascout')
+
+    def test_stop_pondering_workers(self):
+        # Timed pondering runs the workers until it is cancelled
+        agent = goku.Goku(seed=4, threat_nodes=0, engine='mcts', workers=2)
+        try:
+            agent.ponder(self.board, time_limit=0.2)
+            time.sleep(0.3)
+            start = time.time()
+            agent.stop_pondering()
+            self.assertLess(time.time() - start, 2)
+            self.assertIsNotNone(agent.next_move(self.board, time_limit=0.2))
+        finally:
+            agent.close()
+
+
+class MatchTest(unittest.TestCase):
+    def test_play_game(self):
+        engine = {'max_level': 1, 'threat_nodes': 0}
+        result, moves = match.play_game(engine, engine, [(7, 7), (7, 8)],
+                                        max_moves=6)
+        self.assertEqual(result, 0)
+        self.assertEqual(len(moves), 6)
+        self.assertEqual(moves[:2], [(7, 7), (7, 8)])
+        self.assertEqual(len(set(moves)), 6)
+
+    def test_run_match(self):
+        engine = {'max_level': 1, 'threat_nodes': 0}
+        statistics = match.run_match(engine, engine, games=2, workers=1,
+                                     openings='book', seed=0)
+        self.assertEqual(statistics['games'], 2)
+        self.assertEqual(statistics['wins'] + statistics['draws'] +
+                         statistics['losses'], 2)
+
+    def test_board_sizes(self):
+        self.assertEqual(match.book_opening(0), [(7, 7), (7, 8)])
+        self.assertEqual(match.book_opening(len(match.OPENINGS) + 1, 9),
+                         [(4, 4), (3, 5)])
+        with self.assertRaises(ValueError):
+            match.book_opening(5, 4)
+
+        engine = {'max_level': 1, 'threat_nodes': 0}
+        for openings in ('book', 'random'):
+            output = io.StringIO()
+            match.run_match(engine, engine, games=2, workers=1,
+                            openings=openings, max_moves=6, seed=0,
+                            output=output, size=9)
+            for line in output.getvalue().splitlines():
+                moves = json.loads(line)['moves']
+                self.assertEqual(len(moves), 6)
+                self.assertTrue(all(0 <= row < 9 and 0 <= col < 9
+                                    for row, col in moves))
+
+    def test_elo_difference(self):
+        self.assertEqual(match.elo_difference(5, 0, 5)[0], 0)
+        elo, margin = match.elo_difference(75, 0, 25)
+        self.assertAlmostEqual(elo, 190.8, places=1)
+        self.assertLess(margin, elo)
+        self.assertEqual(match.elo_difference(3, 0, 0)[0], float('inf'))
+
+
+class AnalysisTest(unittest.TestCase):
+    # The second player does not block the four and loses
+    GAMES = ['# Comments and blank lines are skipped',
+             '15 1-0 h8 h7 h9 a1 h10 c1 h11 e1 h12',
+             '',
+             '9 * e5 f6']
+
+    def test_records(self):
+        games = list(records.read_records(io.StringIO('\n'.join(self.GAMES))))
+        self.assertEqual(len(games), 2)
+        self.assertEqual(games[0].moves[:2], [(7, 7), (6, 7)])
+        self.assertEqual(games[0].result, 1)
+        self.assertEqual(games[1].size, 9)
+        self.assertEqual([records.format_record(game) for game in games],
+                         [self.GAMES[1], self.GAMES[3]])
+        self.assertEqual(records.replay(games[0]).winner(), 'X')
+        with self.assertRaises(ValueError):
+            records.parse_record('9 1-0 e5 j10')
+
+    def test_analyse(self):
+        output = io.StringIO()
+        summary = analysis.analyse(
+            records.read_records(io.StringIO('\n'.join(self.GAMES))),
+            {'max_level': 2, 'threat_nodes': 0}, output, workers=2,
+            pending=3)
+        lines = [json.loads(line) for line in output.getvalue().splitlines()]
+        self.assertEqual(summary['games'], 2)
+        self.assertEqual(summary['positions'], 11)
+        self.assertEqual([(line['game'], line['ply']) for line in lines],
+                         [(0, ply) for ply in range(9)] + [(1, 0), (1, 1)])
+        missed_block = lines[7]
+        self.assertEqual(missed_block['best_move'], [11, 7])
+        self.assertTrue(missed_block['blunder'])
+        self.assertEqual(missed_block['played_value'], -(WIN_SCORE - 1))
+        self.assertFalse(lines[8]['blunder'])
+
+    def test_compared_values(self):
+        # A deeper (e.g. time limited) search is not compared with the
+        # fixed depth one of the played move: the best move is searched again
+        agent = goku.Goku(seed=0, threat_nodes=0)
+        game = records.parse_record(self.GAMES[1])
+        board = records.replay(game, 7).relabel({'O': 'G', 'X': 'X'})
+        stones = len(board)
+        best_value, played_value = analysis._compared_values(
+            agent, board, (0, 4), (11, 7), 1.0, 8, None)
+        self.assertEqual(best_value, analysis._move_value(
+            agent, board, board.index((11, 7)), SEARCH_DEPTH - 1))
+        self.assertEqual(played_value, -(WIN_SCORE - 1))
+        self.assertEqual(len(board), stones)
+
+
+class EngineProtocolTest(unittest.TestCase):
+    def test_game(self):
+        commands = ['ABOUT', 'START 20', 'INFO timeout_turn 300',
+                    'INFO max_memory 83886080', 'INFO rule 0', 'BEGIN',
+                    'TURN 11,10', 'TAKEBACK 11,10', 'TURN 12,12',
+                    'BOARD', '10,10,1', '11,10,1', '12,10,1', '13,10,1',
+                    '10,11,2', '11,11,2', '12,11,2', 'DONE',
+                    'TURN 10,10', 'YXSHOWINFO', 'END', 'BEGIN']
+        output = io.StringIO()
+        start = time.time()
+        pbrain.main(io.StringIO('\n'.join(commands) + '\n'), output)
+        self.assertLess(time.time() - start, 2.5)
+
+        answers = output.getvalue().splitlines()
+        self.assertEqual(answers[:3], [pbrain.ABOUT, 'OK', '10,10'])
+        self.assertRegex(answers[3], r'^\d+,\d+$')
+        self.assertEqual(answers[4], 'OK')
+        self.assertNotIn(answers[5], ('10,10', '12,12'))
+        # Goku completes the five from the given board
+        self.assertIn(answers[6], ('9,10', '14,10'))
+        self.assertEqual(answers[7][:5], 'ERROR')
+        self.assertEqual(answers[8], 'UNKNOWN YXSHOWINFO')
+        self.assertEqual(len(answers), 9)
+
+    def test_rectstart(self):
+        engine = pbrain.Engine()
+        engine.handle('INFO timeout_turn 300')
+        self.assertEqual(engine.handle('RECTSTART 15,15'), ['OK'])
+        self.assertEqual(engine.board.size, 15)
+        self.assertEqual(engine.handle('BEGIN'), ['7,7'])
+        self.assertEqual(engine.handle('RECTSTART 15,20')[0][:5], 'ERROR')
+
+    def test_limits(self):
+        engine = pbrain.Engine()
+        engine.handle('INFO timeout_turn 5000')
+        engine.handle('INFO time_left 20000')
+        self.assertAlmostEqual(engine.turn_time(),
+                               2 - pbrain.TIME_RESERVE)
+        engine.handle('INFO timeout_turn 0')
+        self.assertEqual(engine.turn_time(), pbrain.MIN_TURN_TIME)
+
+        engine.handle('INFO max_memory 104857600')
+        self.assertEqual(engine.table_size_mb(),
+                         100 - pbrain.MEMORY_OVERHEAD_MB)
+        self.assertEqual(engine.handle('TURN 7,7')[0][:5], 'ERROR')
+
+
+class BenchmarkTest(unittest.TestCase):
+    def test_run(self):
+        results = benchmark.run(['opening', 'tactical_four'],
+                                max_level=2, min_time=0.001)
+        self.assertEqual(sorted(results['positions']),
+                         ['opening', 'tactical_four'])
+        search = results['positions']['tactical_four']['search']
+        self.assertEqual([depth['depth'] for depth in search], [1, 2])
+        self.assertGreater(search[-1]['nodes'], 0)
+        json.loads(json.dumps(results))
+
+    def test_run_workers(self):
+        results = benchmark.run(['tactical_four'], max_level=2,
+                                min_time=0.001, workers=[2])
+        search = results['positions']['tactical_four']['workers']['2']
+        self.assertEqual([depth['depth'] for depth in search], [1, 2])
+        self.assertGreater(search[-1]['nodes'], 0)
+        self.assertGreater(search[-1]['speedup'], 0)
+
+
 if __name__ == '__main__':  # pragma: no cover
     unittest.main()
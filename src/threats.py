@@ -0,0 +1,165 @@
+from bitboard import bits, popcount
+from constants import VCF_DEPTH, VCT_DEPTH, THREAT_NODES
+
+
+class ThreatLimit(Exception):
+    """
+        Raised inside the solver when its node limit is reached
+    """
+
+
+class ThreatSolver:
+    """
+        Looks for forced wins made only of threats, which full width search
+    needs many plies to see: victory by continuous fours (VCF), where every
+    attacker move makes a four and the defender has a single reply, and
+    victory by continuous threats (VCT), which also allows threes that
+    threaten an open four. Both work on a copy of the given Bitboard and
+    return the winning line as positions (attacker and defender moves
+    alternated), or None.
+    """
+
+    def __init__(self, max_nodes=THREAT_NODES):
+        self.max_nodes = max_nodes
+        self.nodes = 0
+
+    def vcf(self, board, attacker='G', defender='X', max_depth=VCF_DEPTH):
+        return self._solve(self._vcf, board, attacker, defender, max_depth)
+
+    def vct(self, board, attacker='G', defender='X', max_depth=VCT_DEPTH):
+        return self._solve(self._vct, board, attacker, defender, max_depth)
+
+    def _solve(self, search, board, attacker, defender, max_depth):
+        self._board = board.copy()
+        self._attacker = attacker
+        self._defender = defender
+        self._failed = {}
+        self.nodes = 0
+        try:
+            line = search(max_depth)
+        except ThreatLimit:
+            return None
+        if line is None:
+            return None
+        return [board.position(index) for index in line]
+
+    def _visit(self):
+        self.nodes += 1
+        if self.nodes > self.max_nodes:
+            raise ThreatLimit()
+
+    def _forced_moves(self, four_only):
+        """
+            Attacker movements to try, or None when the attacker is lost:
+        the defender completes five before any threat matters. When the
+        defender has a four, blocking it is the only option.
+        """
+        board = self._board
+        defender_fives = board.five_cells(self._defender)
+        if defender_fives:
+            if popcount(defender_fives) > 1:
+                return None
+            return list(bits(defender_fives))
+        moves = board.four_cells(self._attacker)
+        if not four_only:
+            moves |= board.threat_cells(self._attacker, 2)
+        return list(bits(moves))
+
+    def _vcf(self, depth):
+        board = self._board
+        attacker, defender = self._attacker, self._defender
+        self._visit()
+
+        wins = board.five_cells(attacker)
+        if wins:
+            return [next(bits(wins))]
+        key = (board.mask(attacker), board.mask(defender), 'vcf')
+        if depth == 0 or self._failed.get(key, -1) >= depth:
+            return None
+
+        for move in self._forced_moves(four_only=True) or ():
+            board.place(move, attacker)
+            gains = board.five_cells(attacker)
+            line = None
+            if popcount(gains) > 1:
+                # Open (or double) four, the defender can not block both
+                line = [move]
+            elif gains:
+                reply = next(bits(gains))
+                board.place(reply, defender)
+                line = self._vcf(depth - 1)
+                board.remove(reply)
+                if line is not None:
+                    line = [move, reply] + line
+            board.remove(move)
+            if line is not None:
+                return line
+
+        self._failed[key] = depth
+        return None
+
+    def _vct(self, depth):
+        board = self._board
+        attacker, defender = self._attacker, self._defender
+
+        line = self._vcf(VCF_DEPTH)
+        if line is not None:
+            return line
+        key = (board.mask(attacker), board.mask(defender), 'vct')
+        if depth == 0 or self._failed.get(key, -1) >= depth:
+            return None
+
+        for move in self._forced_moves(four_only=False) or ():
+            board.place(move, attacker)
+            line = self._refute(move, depth)
+            board.remove(move)
+            if line is not None:
+                return line
+
+        self._failed[key] = depth
+        return None
+
+    def _refute(self, move, depth):
+        """
+            Tries every defence against the attacker's move. Returns the line
+        against the last defence if none of them works, None otherwise.
+        """
+        board = self._board
+        attacker, defender = self._attacker, self._defender
+        gains = board.five_cells(attacker)
+        if popcount(gains) > 1:
+            return [move]
+        if gains:
+            defences = gains
+        elif self._threatens_open_four():
+            # Blocking any cell of the coming four, or counter attacking
+            defences = (board.four_cells(attacker) |
+                        board.four_cells(defender))
+        else:
+            return None
+
+        line = None
+        for defence in bits(defences):
+            board.place(defence, defender)
+            line = self._vct(depth - 1)
+            board.remove(defence)
+            if line is None:
+                return None
+            line = [move, defence] + line
+        return line
+
+    def _threatens_open_four(self):
+        """
+            Whether the attacker can make an open four (two cells completing
+        five) on the next move
+        """
+        board = self._board
+        attacker = self._attacker
+        for move in bits(board.four_cells(attacker)):
+            self._visit()
+            board.place(move, attacker)
+            open_four = popcount(board.five_cells(attacker)) > 1
+            board.remove(move)
+            if open_four:
+                return True
+        return False
@@ -1,37 +1,244 @@
+import argparse
+import struct
 import numpy as np
+from bitboard import Geometry
 from constants import BOARD_SIZE
 
+# Bound flags of the stored scores
+EMPTY = 0
+EXACT = 1
+LOWER = 2
+UPPER = 3
+
+# Bytes per entry: key, score, move, depth, flag and generation
+ENTRY_SIZE = 8 + 8 + 4 + 2 + 1 + 1
+
+# File layout: header (board size, seed, buckets and number of entries),
+# then one array per field of the stored entries, plus their slots
+HEADER = struct.Struct('<4sHHQQQ')
+MAGIC = b'GOKT'
+# Version 2: scores are from the point of view of the player to move
+VERSION = 2
+FIELD_TYPES = ('<u8', '<i2', '<f8', '<i1', '<i4', '<u4')
+
 
 class TranspositionTable:
-    def __init__(self):
-        self._init_zobrist_hash()
-        self._table = {}
+    """
+        Fixed size hash table of already searched positions. Entries live in
+    NumPy arrays grouped in buckets of two slots: the first one keeps the
+    deepest search of the current generation and the second one is always
+    replaced. Calling new_search between moves ages the old entries, so
+    they can be replaced even when deeper.
+        Without a seed, one is drawn, so any table can be saved and loaded
+    (or merged) with the same Zobrist keys.
+    """
+
+    def __init__(self, size=BOARD_SIZE, seed=None, size_mb=16):
+        if seed is None:
+            seed = int(np.random.randint(2 ** 31))
+        self.size = size
+        self.seed = seed
+        self._init_zobrist_hash(size, seed)
+        self._init_table(size_mb)
+
+    def probe(self, key):
+        """
+            Returns the (depth, score, flag, move) stored for the hash key,
+        or None if the position is not on the table
+        """
+        slot = (key & self._bucket_mask) << 1
+        if int(self._keys[slot]) != key:
+            slot += 1
+            if int(self._keys[slot]) != key:
+                return None
+        if self._flags[slot] == EMPTY:
+            return None
+        return (int(self._depths[slot]),
+                float(self._scores[slot]),
+                int(self._flags[slot]),
+                int(self._moves[slot]))
+
+    def store(self, key, depth, score, flag, move=-1):
+        slot = (key & self._bucket_mask) << 1
+        if (int(self._keys[slot]) != key and
+                self._generations[slot] == self._generation and
+                depth < self._depths[slot]):
+            slot += 1
+        self._keys[slot] = key
+        self._depths[slot] = depth
+        self._scores[slot] = score
+        self._flags[slot] = flag
+        self._moves[slot] = move
+        self._generations[slot] = self._generation
+
+    def entries(self, min_depth=0):
+        """
+            Arrays with the keys, depths, scores, flags and moves of the
+        entries stored since the last new_search, at least min_depth deep
+        """
+        selected = ((self._flags != EMPTY) &
+                    (self._generations == self._generation) &
+                    (self._depths >= min_depth))
+        return (self._keys[selected],
+                self._depths[selected],
+                self._scores[selected],
+                self._flags[selected],
+                self._moves[selected])
 
-    def contains(self, key):
-        key in self._table
+    def merge(self, entries):
+        """
+            Stores the entries (as returned by 'entries') of another table
+        with the same Zobrist keys, following the replacement scheme
+        """
+        for key, depth, score, flag, move in zip(*entries):
+            self.store(int(key), int(depth), float(score), int(flag),
+                       int(move))
 
-    def insert(self, key, value):
-        self._table[key] = value
+    def save(self, path):
+        """
+            Writes the entries of every generation, with the seed of the
+        Zobrist keys, so the table can be loaded in another process
+        """
+        slots = np.flatnonzero(self._flags != EMPTY)
+        fields = (self._keys, self._depths, self._scores, self._flags,
+                  self._moves, slots)
+        with open(path, 'wb') as table_file:
+            table_file.write(HEADER.pack(MAGIC, VERSION, self.size,
+                                         self.seed, len(self._keys) // 2,
+                                         len(slots)))
+            for field, dtype in zip(fields[:-1], FIELD_TYPES):
+                table_file.write(field[slots].astype(dtype).tobytes())
+            table_file.write(slots.astype(FIELD_TYPES[-1]).tobytes())
 
-    def value(self, key):
-        self._table[key]
+    @classmethod
+    def load(cls, path, size_mb=None):
+        """
+            Table saved on the file. With the saved size, the entries go back
+        to their slots at once, otherwise they are merged one by one.
+        """
+        size, seed, buckets, entries, slots = _read_table(path)
+        if size_mb is None:
+            size_mb = buckets * 2 * ENTRY_SIZE / 2 ** 20
+        table = cls(size, seed, size_mb)
+        if len(table._keys) == 2 * buckets:
+            fields = (table._keys, table._depths, table._scores,
+                      table._flags, table._moves)
+            for field, values in zip(fields, entries):
+                field[slots] = values
+        else:
+            table.merge(entries)
+        return table
 
-    def hash_key(self, board):
+    def merge_file(self, path):
         """
-            Finds the hash key for a board state
+            Stores the entries of a saved table, e.g. one of a self play
+        worker. It must have the same board size and Zobrist seed.
         """
-        hash_key = 0
-        for position in np.argwhere(board != '.'):
-            position = tuple(position)
-            item_index = 0 if board[position] == 'G' else 1
-            item_hash_value = int(self._zobrist_hash[position][item_index])
-            hash_key = np.bitwise_xor(hash_key, item_hash_value)
+        size, seed, _, entries, _ = _read_table(path)
+        if (size, seed) != (self.size, self.seed):
+            raise ValueError('{} was saved with other Zobrist keys'
+                             .format(path))
+        self.merge(entries)
+
+    def new_search(self):
+        self._generation = (self._generation + 1) % 256
+
+    def clear(self):
+        self._flags[:] = EMPTY
+        self._depths[:] = -1
+        self._keys[:] = 0
+
+    def __len__(self):
+        return int(np.count_nonzero(self._flags))
+
+    def hash_key(self, board, current_player='G'):
+        """
+            Finds the hash key for a board state, given as a Bitboard, with
+        the given player to move
+        """
+        hash_key = 0 if current_player == 'G' else self._side_hash
+        for symbol in board.symbols():
+            keys = self._zobrist_hash[self._item_index(symbol)]
+            for index in board.stones(symbol):
+                hash_key ^= keys[index]
         return hash_key
 
-    def _init_zobrist_hash(self):
+    def update(self, hash_key, index, symbol):
+        """
+            Returns the hash key after placing (or removing) the symbol on the
+        given index. The side to move changes on both cases.
+        """
+        return (hash_key ^
+                self._zobrist_hash[self._item_index(symbol)][index] ^
+                self._side_hash)
+
+    @staticmethod
+    def _item_index(symbol):
+        return 0 if symbol == 'G' else 1
+
+    def _init_table(self, size_mb):
+        """
+            Allocates the biggest power of two number of buckets that fits
+        in the given size
+        """
+        buckets = max(1, int(size_mb * 2 ** 20) // (2 * ENTRY_SIZE))
+        buckets = 1 << (buckets.bit_length() - 1)
+        self._bucket_mask = buckets - 1
+        self._keys = np.zeros(2 * buckets, dtype=np.uint64)
+        self._scores = np.zeros(2 * buckets, dtype=np.float64)
+        self._moves = np.full(2 * buckets, -1, dtype=np.int32)
+        self._depths = np.full(2 * buckets, -1, dtype=np.int16)
+        self._flags = np.zeros(2 * buckets, dtype=np.int8)
+        self._generations = np.zeros(2 * buckets, dtype=np.uint8)
+        self._generation = 0
+
+    def _init_zobrist_hash(self, size, seed):
         """
             Creates a Zobrist Table, to extract the hash value of each
-        board state of the game. i.e. creates BOARD_SIZE x BOARD_SIZE
-        matrix with 2 random numbers each, as we have 2 symbols.
+        board state of the game. i.e. 2 random 64 bits keys for every cell of
+        the board, as we have 2 symbols, plus one for the side to move. The
+        same seed always gives the same keys.
         """
-        self._zobrist_hash = 1e6 * np.random.rand(BOARD_SIZE, BOARD_SIZE, 2)
+        cells = Geometry.of(size).cells
+        random = np.random.RandomState(seed)
+        keys = random.randint(0, 2 ** 64, size=(2 * cells + 1,),
+                              dtype=np.uint64)
+        keys = [int(key) for key in keys]
+        self._zobrist_hash = (keys[:cells], keys[cells:2 * cells])
+        self._side_hash = keys[-1]
+
+
+def _read_table(path):
+    """
+        Board size, seed, number of buckets, entries (as returned by
+    TranspositionTable.entries) and slots of a saved table
+    """
+    with open(path, 'rb') as table_file:
+        data = table_file.read()
+    magic, version, size, seed, buckets, count = HEADER.unpack_from(data, 0)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError('{} is not a transposition table file'.format(path))
+    fields = []
+    offset = HEADER.size
+    for dtype in FIELD_TYPES:
+        dtype = np.dtype(dtype)
+        fields.append(np.frombuffer(data, dtype, count, offset))
+        offset += count * dtype.itemsize
+    return size, seed, buckets, tuple(fields[:-1]), fields[-1]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Merges saved transposition tables into one')
+    parser.add_argument('output', help='table file to write')
+    parser.add_argument('tables', nargs='+', help='table files to merge')
+    parser.add_argument('--size-mb', type=float, default=None,
+                        help='size of the merged table (default: the first)')
+    args = parser.parse_args()
+
+    merged = TranspositionTable.load(args.tables[0], args.size_mb)
+    for path in args.tables[1:]:
+        merged.new_search()
+        merged.merge_file(path)
+    merged.save(args.output)
+    print('{} entries written to {}'.format(len(merged), args.output))
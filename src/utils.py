@@ -1,23 +1,17 @@
 import numpy as np
 import regex as re
-from constants import DIRECTION_CHANGE_ENUM
-from constants import BOARD_SIZE
-
-
-def spiral_new_direction(current):
-    return DIRECTION_CHANGE_ENUM[current]
-
-
-def sum_tuples(first, second):
-    return tuple(np.sum((first, second), axis=0))
+from bitboard import Bitboard
 
 
 def find(symbol, pattern, board):
     """
         Find all the occurrences of a given symbol, 'pattern' times in
     sequence for the given board. Searches for rows, columns, diagonals
-    and inverted diagonals
+    and inverted diagonals. The board may have any size.
     """
+    if isinstance(board, Bitboard):
+        return board.count(symbol, pattern)
+
     def count_row(board, start=0):
         for row in board:
             row_string = ''.join(row)
@@ -27,8 +21,9 @@ def find(symbol, pattern, board):
         return start
 
     def count_diag(board, start=0):
-        index = - (BOARD_SIZE + 1)
-        while index < BOARD_SIZE:
+        size = len(board)
+        index = - (size + 1)
+        while index < size:
             diag_string = ''.join(board.diagonal(index))
             start += len(re.findall(r'[' + symbol + r']{' + str(pattern) + '}',
                          diag_string,